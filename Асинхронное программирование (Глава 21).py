@@ -339,6 +339,818 @@ async def download_one(client: httpx.AsyncClient,
         print(cc, msg)
     return status
 
+# Кеширование загрузок на диске и условные GET-запросы
+'''
+Тот же прием, что и в главе 20: тела ответов хранятся на диске под именем, равным SHA-256 содержимого, а вместе с ними -
+валидаторы ETag и Last-Modified. При повторном запуске запросы отправляются с заголовками If-None-Match и If-Modified-Since,
+и на неизменившиеся флаги и файлы metadata.json сервер отвечает кодом 304 без тела.
+Чтение и запись файлов кеша - блокирующий ввод-вывод, поэтому, как и save_flag, они выполняются через asyncio.to_thread.
+Значит, индекс обновляется из потоков пула, и, как в главе 20, доступ к нему защищен блокировкой.
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+CACHE_DIR = Path('http_cache')
+
+class HTTPCache:
+    '''Кеш ответов на диске: тела в файлах с именами по SHA-256, индекс url -> {digest, etag, last_modified} в index.json'''
+
+    def __init__(self, cache_dir: Path = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.index_path = cache_dir / 'index.json'
+        cache_dir.mkdir(exist_ok=True)
+        try:
+            self.index: dict[str, dict] = json.loads(self.index_path.read_text())
+        except FileNotFoundError:
+            self.index = {}
+        self.lock = threading.Lock()
+
+    def validators(self, url: str) -> dict[str, str]:
+        with self.lock:
+            entry = self.index.get(url)
+        if entry is None or not (self.cache_dir / entry['digest']).exists():
+            return {}
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def body(self, url: str) -> bytes:
+        with self.lock:
+            digest = self.index[url]['digest']
+        return (self.cache_dir / digest).read_bytes()
+
+    def write_atomic(self, path: Path, data: bytes) -> None:
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp') # Уникальное имя: один и тот же файл могут
+                                                                           # записывать сразу несколько потоков
+        try:
+            with open(fd, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmp_name, path) # Переименование атомарно, поэтому никто не увидит недописанный файл
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+    def store(self, url: str, response: httpx.Response) -> bytes:
+        body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+        blob = self.cache_dir / digest
+        if not blob.exists():
+            self.write_atomic(blob, body)
+        with self.lock:
+            self.index[url] = {'digest': digest,
+                               'etag': response.headers.get('ETag'),
+                               'last_modified': response.headers.get('Last-Modified')}
+        return body
+
+    def save(self) -> None:
+        with self.lock:
+            data = json.dumps(self.index).encode()
+        self.write_atomic(self.index_path, data)
+
+async def cached_get(client: httpx.AsyncClient, cache: HTTPCache, url: str) -> bytes:
+    headers = await asyncio.to_thread(cache.validators, url) # validators обращается к диску - не блокируем цикл событий
+    response = await client.get(url, headers=headers, timeout=6.1, follow_redirects=True)
+    if response.status_code == HTTPStatus.NOT_MODIFIED:
+        try:
+            return await asyncio.to_thread(cache.body, url) # Тело не передавалось по сети - читаем его из кеша
+        except FileNotFoundError: # Файл удалили уже после проверки в validators - повторить запрос без условий
+            response = await client.get(url, timeout=6.1, follow_redirects=True)
+    response.raise_for_status()
+    return await asyncio.to_thread(cache.store, url, response)
+
+async def get_flag(client: httpx.AsyncClient, cache: HTTPCache, base_url: str, cc: str) -> bytes:
+    url = f'{base_url}/{cc}/{cc}.gif'.lower()
+    return await cached_get(client, cache, url)
+
+async def get_country(client: httpx.AsyncClient, cache: HTTPCache, base_url: str, cc: str) -> str:
+    url = f'{base_url}/{cc}/metadata.json'.lower()
+    metadata = json.loads(await cached_get(client, cache, url))
+    return metadata['country']
+
+async def download_one(client: httpx.AsyncClient,
+                       cache: HTTPCache,
+                       cc: str,
+                       base_url: str,
+                       semaphore: asyncio.Semaphore,
+                       verbose: bool) -> DownloadStatus:
+    try:
+        async with semaphore:
+            image = await get_flag(client, cache, base_url, cc)
+        async with semaphore:
+            country = await get_country(client, cache, base_url, cc)
+    except httpx.HTTPStatusError as exc:
+        res = exc.response
+        if res.status_code == HTTPStatus.NOT_FOUND:
+            status = DownloadStatus.NOT_FOUND
+            msg = f'not found: {res.url}'
+        else:
+            raise
+    else:
+        filename = country.replace(' ', '_')
+        await asyncio.to_thread(save_flag, image, f'{filename}.gif')
+        status = DownloadStatus.OK
+        msg = 'OK'
+    if verbose and msg:
+        print(cc, msg)
+    return status
+
+async def supervisor(cc_list: list[str], base_url: str, verbose: bool, concur_req: int) -> Counter[DownloadStatus]:
+    counter: Counter[DownloadStatus] = Counter()
+    semaphore = asyncio.Semaphore(concur_req)
+    cache = HTTPCache() # Один кеш на весь пакет загрузок; store выполняется в потоках пула, поэтому индекс защищен блокировкой
+    async with httpx.AsyncClient() as client:
+        to_do = [download_one(client, cache, cc, base_url, semaphore, verbose) for cc in sorted(cc_list)]
+        for coro in asyncio.as_completed(to_do):
+            try:
+                status = await coro
+            except httpx.HTTPError as exc:
+                status = DownloadStatus.ERROR
+                if verbose:
+                    print(f'{Path(str(exc.request.url)).stem.upper()} error: {exc}')
+            counter[status] += 1
+    await asyncio.to_thread(cache.save) # Сохранить индекс, чтобы следующий запуск мог отправлять условные запросы
+    return counter
+
+if __name__ == '__main__':
+    main(download_many, DEFAULT_CONCUR_REQ, MAX_CONCUR_REQ) # download_many и main - те же, что и выше
+
+# Потоковая загрузка на диск
+'''
+get_flag возвращает response.content - все тело ответа в виде bytes, а save_flag затем записывает его целиком. Для больших
+файлов это удваивает пиковое потребление памяти на каждый активный запрос. Метод client.stream() позволяет читать тело
+порциями по мере поступления из сети и сразу же записывать их во временный файл, который в конце атомарно переименовывается
+в целевой. Тогда пиковое потребление памяти ограничено величиной CHUNK_SIZE * concur_req.
+'''
+
+import tempfile
+import threading
+
+CHUNK_SIZE = 64 * 1024
+
+_file_mode: int | None = None
+_file_mode_lock = threading.Lock()
+
+def file_mode() -> int:
+    '''Права, с которыми файл создал бы open(); mkstemp создает файл с правами 0600.
+    Узнать текущую маску можно, только установив новую, а маска общая для всего процесса: пока она равна 0, файлы,
+    созданные другими потоками, получат лишние права. Поэтому маска читается один раз, под блокировкой, и supervisor
+    делает это до запуска загрузок, а не при импорте модуля.'''
+    global _file_mode
+    with _file_mode_lock:
+        if _file_mode is None:
+            umask = os.umask(0)
+            os.umask(umask) # Сразу вернуть прежнюю маску
+            _file_mode = 0o666 & ~umask
+    return _file_mode
+
+async def stream_to_file(client: httpx.AsyncClient, url: str, path: Path, chunk_size: int = CHUNK_SIZE) -> int:
+    '''Загрузить url в файл path порциями по chunk_size байтов; вернуть количество записанных байтов'''
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.part') # Временный файл создается
+                                                                                               # в том же каталоге, иначе
+                                                                                               # переименование не будет атомарным
+    tmp = Path(tmp_name)
+    size = 0
+    try:
+        with open(fd, 'wb') as fp:
+            async with client.stream('GET', url, timeout=6.1, follow_redirects=True) as response: # Заголовки уже получены,
+                                                                                                   # а тело еще нет
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(chunk_size):
+                    fp.write(chunk) # Запись порции ограниченного размера попадает в страничный кеш ОС и завершается быстро,
+                                    # поэтому ее не нужно передавать в отдельный поток, как save_flag
+                    size += len(chunk)
+        tmp.chmod(file_mode()) # Иначе после переименования флаг остался бы доступен только владельцу
+        tmp.replace(path) # Файл path либо отсутствует, либо содержит полное тело - недописанных файлов не бывает
+    except BaseException: # В том числе CancelledError: не оставлять за собой временные файлы
+        tmp.unlink(missing_ok=True)
+        raise
+    return size
+
+async def download_one(client: httpx.AsyncClient,
+                       cc: str,
+                       base_url: str,
+                       semaphore: asyncio.Semaphore,
+                       verbose: bool) -> DownloadStatus:
+    url = f'{base_url}/{cc}/{cc}.gif'.lower()
+    try:
+        async with semaphore:
+            size = await stream_to_file(client, url, DEST_DIR / f'{cc}.gif')
+    except httpx.HTTPStatusError as exc:
+        res = exc.response
+        if res.status_code == HTTPStatus.NOT_FOUND:
+            status = DownloadStatus.NOT_FOUND
+            msg = f'not found: {res.url}'
+        else:
+            raise
+    else:
+        status = DownloadStatus.OK
+        msg = f'OK {size} bytes'
+    if verbose and msg:
+        print(cc, msg)
+    return status
+
+async def supervisor(cc_list: list[str], base_url: str, verbose: bool, concur_req: int) -> Counter[DownloadStatus]:
+    counter: Counter[DownloadStatus] = Counter()
+    semaphore = asyncio.Semaphore(concur_req) # Семафор ограничивает не только число запросов, но и число буферов
+                                              # размером CHUNK_SIZE, существующих одновременно
+    file_mode() # Прочитать маску, пока загрузки и связанные с ними потоки еще не запущены
+    async with httpx.AsyncClient() as client:
+        to_do = [download_one(client, cc, base_url, semaphore, verbose) for cc in sorted(cc_list)]
+        for coro in asyncio.as_completed(to_do):
+            try:
+                status = await coro
+            except httpx.HTTPError as exc:
+                status = DownloadStatus.ERROR
+                if verbose:
+                    print(f'{Path(str(exc.request.url)).stem.upper()} error: {exc}')
+            counter[status] += 1
+    return counter
+
+if __name__ == '__main__':
+    main(download_many, DEFAULT_CONCUR_REQ, MAX_CONCUR_REQ)
+
+# Одновременная отправка запросов флага и метаданных
+'''
+download_one из раздела "Отправка нескольких запросов при каждой загрузке" дважды захватывает семафор и выполняет запросы
+get_flag и get_country последовательно, хотя они независимы. Можно запустить оба запроса сразу внутри одного "слота"
+семафора и объединить результаты, только когда завершатся оба. Время обработки одной страны при этом сокращается примерно
+вдвое: вместо суммы двух задержек мы ждем максимальную из них.
+Один AsyncClient на все загрузки держит пул постоянных (keep-alive) соединений, поэтому второй запрос к тому же хосту не
+устанавливает новое TCP/TLS-соединение. По HTTP/1.1 два одновременных запроса все же займут два соединения из пула;
+чтобы они мультиплексировались в одном соединении, нужен HTTP/2: httpx.AsyncClient(http2=True) и пакет h2.
+'''
+
+async def get_flag_and_country(client: httpx.AsyncClient,
+                               cache: HTTPCache,
+                               base_url: str,
+                               cc: str) -> tuple[bytes, str]:
+    flag_task = asyncio.create_task(get_flag(client, cache, base_url, cc)) # Обе задачи запускаются сразу
+    country_task = asyncio.create_task(get_country(client, cache, base_url, cc))
+    try:
+        image, country = await asyncio.gather(flag_task, country_task) # Результаты объединяются, когда готовы оба
+    except BaseException:
+        flag_task.cancel() # gather не отменяет оставшиеся задачи, если одна из них возбудила исключение, - это нужно
+        country_task.cancel() # сделать самим, чтобы не занимать соединение запросом, результат которого уже не нужен
+        raise
+    return image, country
+
+async def download_one(client: httpx.AsyncClient,
+                       cache: HTTPCache,
+                       cc: str,
+                       base_url: str,
+                       semaphore: asyncio.Semaphore,
+                       verbose: bool) -> DownloadStatus:
+    try:
+        async with semaphore: # Семафор захватывается один раз на страну, а не на каждый запрос
+            image, country = await get_flag_and_country(client, cache, base_url, cc)
+    except httpx.HTTPStatusError as exc:
+        res = exc.response
+        if res.status_code == HTTPStatus.NOT_FOUND:
+            status = DownloadStatus.NOT_FOUND
+            msg = f'not found: {res.url}'
+        else:
+            raise
+    else:
+        filename = country.replace(' ', '_')
+        await asyncio.to_thread(save_flag, image, f'{filename}.gif')
+        status = DownloadStatus.OK
+        msg = 'OK'
+    if verbose and msg:
+        print(cc, msg)
+    return status
+
+async def supervisor(cc_list: list[str], base_url: str, verbose: bool, concur_req: int) -> Counter[DownloadStatus]:
+    counter: Counter[DownloadStatus] = Counter()
+    semaphore = asyncio.Semaphore(concur_req)
+    cache = HTTPCache()
+    async with httpx.AsyncClient() as client:
+        to_do = [download_one(client, cache, cc, base_url, semaphore, verbose) for cc in sorted(cc_list)]
+        for coro in asyncio.as_completed(to_do):
+            try:
+                status = await coro
+            except httpx.HTTPError as exc:
+                status = DownloadStatus.ERROR
+                if verbose:
+                    print(f'{Path(str(exc.request.url)).stem.upper()} error: {exc}')
+            counter[status] += 1
+    await asyncio.to_thread(cache.save)
+    return counter
+
+if __name__ == '__main__':
+    main(download_many, DEFAULT_CONCUR_REQ, MAX_CONCUR_REQ)
+
+# Ограничение темпа запросов и общий клиент с пулом соединений
+'''
+Семафор ограничивает число одновременных запросов, но не их темп. Ведро маркеров TokenBucket из главы 20 (здесь оно
+повторено, чтобы пример был самодостаточным) ограничивает число запросов в секунду. Проще всего подключить его на уровне
+транспорта httpx: тогда маркер забирается перед каждым реальным HTTP-запросом, и код download_one и get_flag не меняется.
+'''
+
+import threading
+
+RATE_LIMIT = 10.0
+KEEPALIVE_EXPIRY = 30.0
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock() # Блокировка нужна, только если ведро разделяется с потоками
+
+    def reserve(self, tokens: float = 1) -> float:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self, tokens: float = 1) -> None:
+        if delay := self.reserve(tokens):
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: float = 1) -> None:
+        if delay := self.reserve(tokens):
+            await asyncio.sleep(delay) # Ждет только эта сопрограмма, цикл событий продолжает работать
+
+class RateLimitedAsyncTransport(httpx.AsyncHTTPTransport):
+
+    def __init__(self, bucket: TokenBucket, **kwargs):
+        super().__init__(**kwargs)
+        self.bucket = bucket
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        t0 = time.perf_counter()
+        await self.bucket.acquire_async()
+        waited = time.perf_counter() - t0
+        response = await super().handle_async_request(request)
+        response.extensions['rate_wait'] = waited # По этому значению метрики отделяют ожидание токена от работы сети
+        return response
+
+def make_async_client(bucket: TokenBucket | None = None, max_connections: int = DEFAULT_CONCUR_REQ) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=max_connections,
+                          max_keepalive_connections=max_connections, # Не закрывать соединения между запросами
+                          keepalive_expiry=KEEPALIVE_EXPIRY)
+    if bucket is None:
+        transport = httpx.AsyncHTTPTransport(limits=limits)
+    else:
+        transport = RateLimitedAsyncTransport(bucket, limits=limits)
+    return httpx.AsyncClient(transport=transport, timeout=6.1, follow_redirects=True)
+
+async def supervisor(cc_list: list[str], base_url: str, verbose: bool, concur_req: int) -> Counter[DownloadStatus]:
+    counter: Counter[DownloadStatus] = Counter()
+    semaphore = asyncio.Semaphore(concur_req)
+    cache = HTTPCache()
+    bucket = TokenBucket(RATE_LIMIT)
+    async with make_async_client(bucket, 2 * concur_req) as client: # В каждом слоте семафора по два запроса
+        to_do = [download_one(client, cache, cc, base_url, semaphore, verbose) for cc in sorted(cc_list)]
+        for coro in asyncio.as_completed(to_do):
+            try:
+                status = await coro
+            except httpx.HTTPError as exc:
+                status = DownloadStatus.ERROR
+                if verbose:
+                    print(f'{Path(str(exc.request.url)).stem.upper()} error: {exc}')
+            counter[status] += 1
+    await asyncio.to_thread(cache.save)
+    return counter
+
+if __name__ == '__main__':
+    main(download_many, DEFAULT_CONCUR_REQ, MAX_CONCUR_REQ)
+
+# Метрики загрузки
+'''
+Супервизоры выше сообщают о ходе работы только через tqdm и итоговый Counter[DownloadStatus]. Чтобы понять, на что уходит
+время, когда пакет загружается медленно, нужны события по каждому запросу:
+> start - запрос отправлен;
+> latency - время от отправки запроса до получения ответа, без ожидания токена;
+> rate_wait - сколько запрос ждал токена в ведре ограничителя темпа (RateLimitedAsyncTransport записывает это время
+  в response.extensions; при перенаправлениях ожидания всех запросов цепочки складываются);
+> status - код состояния HTTP;
+> bytes - размер тела ответа;
+> retry - повторная попытка после ошибки соединения или ответа 5XX;
+> queue_wait - сколько сопрограмма ждала свободного места в семафоре.
+Загрузчик передает события объекту Metrics, а тот раздает их приемникам (sinks). Приемником может быть любой объект с
+методом emit - это протокол, как в главе 13. Готовых приемников два: HistogramSink накапливает значения в памяти и умеет
+считать процентили, JSONLinesSink дописывает события в файл по одному JSON-объекту на строку.
+'''
+
+import statistics
+from collections import defaultdict
+from typing import Any, NamedTuple, Protocol
+
+MAX_RETRIES = 2
+RETRY_BACKOFF = 0.5 # Пауза перед первой повторной попыткой в секундах; затем она удваивается
+METRICS_PATH = Path('metrics.jsonl')
+
+class RequestEvent(NamedTuple):
+    kind: str
+    cc: str
+    value: Any
+    timestamp: float # Время по time.time(), чтобы события из файла можно было сопоставить с журналами сервера
+
+class MetricsSink(Protocol):
+    def emit(self, event: RequestEvent) -> None: ...
+
+class HistogramSink:
+
+    def __init__(self):
+        self.values: defaultdict[str, list[float]] = defaultdict(list) # kind -> все числовые значения
+        self.statuses: Counter[int] = Counter()
+        self.requests = 0
+        self.started: float | None = None
+        self.finished: float | None = None
+
+    def emit(self, event: RequestEvent) -> None:
+        if self.started is None:
+            self.started = event.timestamp
+        self.finished = event.timestamp
+        if event.kind == 'start':
+            self.requests += 1
+        elif event.kind == 'status':
+            self.statuses[event.value] += 1
+        else:
+            self.values[event.kind].append(event.value)
+
+    def percentiles(self, kind: str) -> tuple[float, float, float]:
+        '''p50, p95 и p99 значений события kind'''
+        values = self.values[kind]
+        if len(values) < 2:
+            return (values[0],) * 3 if values else (0.0, 0.0, 0.0)
+        cuts = statistics.quantiles(values, n=100, method='inclusive')
+        return cuts[49], cuts[94], cuts[98]
+
+    def summary(self) -> str:
+        elapsed = (self.finished or 0.0) - (self.started or 0.0)
+        throughput = self.requests / elapsed if elapsed else 0.0
+        megabytes = sum(self.values['bytes']) / 2**20
+        p50, p95, p99 = self.percentiles('latency')
+        w50, w95, w99 = self.percentiles('queue_wait')
+        r50, r95, r99 = self.percentiles('rate_wait')
+        return '\n'.join([
+            f'{self.requests} requests, {len(self.values["retry"])} retries, {megabytes:.2f} MiB in {elapsed:.2f}s '
+            f'({throughput:.1f} req/s)',
+            f'latency    p50={p50 * 1000:.0f}ms p95={p95 * 1000:.0f}ms p99={p99 * 1000:.0f}ms',
+            f'queue wait p50={w50 * 1000:.0f}ms p95={w95 * 1000:.0f}ms p99={w99 * 1000:.0f}ms',
+            f'rate wait  p50={r50 * 1000:.0f}ms p95={r95 * 1000:.0f}ms p99={r99 * 1000:.0f}ms',
+            f'statuses   {dict(sorted(self.statuses.items()))}',
+        ])
+
+class JSONLinesSink:
+
+    def __init__(self, path: Path = METRICS_PATH):
+        self.fp = open(path, 'a') # Буферизованная запись: emit не обращается к диску на каждое событие
+
+    def emit(self, event: RequestEvent) -> None:
+        self.fp.write(json.dumps(event._asdict()) + '\n')
+
+    def close(self) -> None:
+        self.fp.close()
+
+class Metrics:
+
+    def __init__(self, *sinks: MetricsSink):
+        self.sinks = sinks
+
+    def emit(self, kind: str, cc: str, value: Any = None) -> None:
+        event = RequestEvent(kind, cc, value, time.time())
+        for sink in self.sinks:
+            sink.emit(event)
+
+async def fetch(client: httpx.AsyncClient, metrics: Metrics, cc: str, url: str) -> httpx.Response:
+    for attempt in range(MAX_RETRIES + 1):
+        metrics.emit('start', cc, url)
+        t0 = time.perf_counter()
+        try:
+            response = await client.get(url, timeout=6.1, follow_redirects=True)
+        except httpx.TransportError:
+            if attempt == MAX_RETRIES:
+                raise
+        else:
+            elapsed = time.perf_counter() - t0
+            rate_wait = sum(r.extensions.get('rate_wait', 0.0) for r in (*response.history, response))
+            metrics.emit('rate_wait', cc, rate_wait)
+            metrics.emit('latency', cc, elapsed - rate_wait)
+            metrics.emit('status', cc, response.status_code)
+            if response.status_code < HTTPStatus.INTERNAL_SERVER_ERROR or attempt == MAX_RETRIES:
+                response.raise_for_status()
+                metrics.emit('bytes', cc, len(response.content))
+                return response
+        metrics.emit('retry', cc, attempt + 1)
+        await asyncio.sleep(RETRY_BACKOFF * 2**attempt)
+    raise AssertionError('unreachable') # Цикл всегда завершается return или raise
+
+async def get_flag(client: httpx.AsyncClient, metrics: Metrics, base_url: str, cc: str) -> bytes:
+    url = f'{base_url}/{cc}/{cc}.gif'.lower()
+    return (await fetch(client, metrics, cc, url)).content
+
+async def get_country(client: httpx.AsyncClient, metrics: Metrics, base_url: str, cc: str) -> str:
+    url = f'{base_url}/{cc}/metadata.json'.lower()
+    return (await fetch(client, metrics, cc, url)).json()['country']
+
+async def download_one(client: httpx.AsyncClient,
+                       metrics: Metrics,
+                       cc: str,
+                       base_url: str,
+                       semaphore: asyncio.Semaphore,
+                       verbose: bool) -> DownloadStatus:
+    t0 = time.perf_counter()
+    try:
+        async with semaphore:
+            metrics.emit('queue_wait', cc, time.perf_counter() - t0)
+            flag_task = asyncio.create_task(get_flag(client, metrics, base_url, cc))
+            country_task = asyncio.create_task(get_country(client, metrics, base_url, cc))
+            try:
+                image, country = await asyncio.gather(flag_task, country_task)
+            except BaseException:
+                flag_task.cancel()
+                country_task.cancel()
+                raise
+    except httpx.HTTPStatusError as exc:
+        res = exc.response
+        if res.status_code == HTTPStatus.NOT_FOUND:
+            status = DownloadStatus.NOT_FOUND
+            msg = f'not found: {res.url}'
+        else:
+            raise
+    else:
+        filename = country.replace(' ', '_')
+        await asyncio.to_thread(save_flag, image, f'{filename}.gif')
+        status = DownloadStatus.OK
+        msg = 'OK'
+    if verbose and msg:
+        print(cc, msg)
+    return status
+
+async def supervisor(cc_list: list[str],
+                     base_url: str,
+                     verbose: bool,
+                     concur_req: int,
+                     metrics: Metrics) -> Counter[DownloadStatus]:
+    counter: Counter[DownloadStatus] = Counter()
+    semaphore = asyncio.Semaphore(concur_req)
+    async with make_async_client(TokenBucket(RATE_LIMIT), 2 * concur_req) as client:
+        to_do = [download_one(client, metrics, cc, base_url, semaphore, verbose) for cc in sorted(cc_list)]
+        for coro in asyncio.as_completed(to_do):
+            try:
+                status = await coro
+            except httpx.HTTPError as exc:
+                status = DownloadStatus.ERROR
+                if verbose:
+                    print(f'{Path(str(exc.request.url)).stem.upper()} error: {exc}')
+            counter[status] += 1
+    return counter
+
+def download_many(cc_list: list[str],
+                  base_url: str,
+                  verbose: bool,
+                  concur_req: int,
+                  metrics: Metrics) -> Counter[DownloadStatus]:
+    return asyncio.run(supervisor(cc_list, base_url, verbose, concur_req, metrics))
+
+def main(download_many, default_concur_req, max_concur_req):
+    cc_list = sorted(POP20_CC)
+    actual_req = min(max_concur_req, len(cc_list))
+    DEST_DIR.mkdir(exist_ok=True)
+    histograms = HistogramSink()
+    jsonl = JSONLinesSink()
+    try:
+        counter = download_many(cc_list, BASE_URL, False, actual_req, Metrics(histograms, jsonl))
+    finally:
+        jsonl.close()
+    print(counter)
+    print(histograms.summary()) # Пропускная способность и процентили задержки по всем запросам пакета
+
+if __name__ == '__main__':
+    main(download_many, DEFAULT_CONCUR_REQ, MAX_CONCUR_REQ)
+
+# Конвейер: загрузка и обработка изображений в пуле процессов
+'''
+Допустим, загруженные флаги нужно еще уменьшить и перекодировать в PNG. Это счетная работа: если выполнять ее прямо в
+сопрограмме, она заблокирует цикл событий, а asyncio.to_thread не поможет из-за GIL. Выход - передать ее пулу процессов
+через loop.run_in_executor, как в главе 20.
+Чтобы загрузка и обработка перекрывались во времени, а не выполнялись двумя отдельными проходами, их связывает ограниченная
+очередь asyncio.Queue(maxsize=...). download_one помещает в нее загруженное тело, а несколько сопрограмм-обработчиков
+извлекают тела и отдают их пулу. Если обработка не успевает, очередь заполняется, await queue.put(...) приостанавливает
+загрузчики, и в памяти никогда не находится больше maxsize необработанных изображений - это обратное давление (backpressure).
+Вместе с телом в очередь кладется будущий объект: обработчик записывает в него размер миниатюры или исключение.
+download_one ждет этот объект и возвращает OK только после успешной обработки, а при ошибке - ERROR (и событие
+postprocess_error в метриках), так что итоговый Counter учитывает и сбои обработки.
+'''
+
+import io
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+THUMB_SIZE = (64, 64)
+PIPELINE_DEPTH = 2 # Во сколько раз очередь длиннее числа процессов в пуле
+
+def make_thumbnail(img: bytes, filename: str) -> int:
+    '''Выполняется в дочернем процессе: уменьшить изображение и сохранить в PNG. Файл записывает сам процесс, чтобы
+    не пересылать результат обратно через канал. Возвращает размер файла.'''
+    with Image.open(io.BytesIO(img)) as image:
+        image.thumbnail(THUMB_SIZE)
+        path = DEST_DIR / filename
+        image.save(path, format='PNG')
+    return path.stat().st_size
+
+async def post_process(queue: asyncio.Queue, pool: ProcessPoolExecutor, verbose: bool) -> None:
+    loop = asyncio.get_running_loop()
+    while True: # Обработчик работает, пока супервизор его не отменит
+        cc, image, result = await queue.get() # result - будущий объект, которого ждет download_one
+        try:
+            size = await loop.run_in_executor(pool, make_thumbnail, image, f'{cc}.png') # Цикл событий свободен, пока
+                                                                                        # дочерний процесс занят
+        except asyncio.CancelledError:
+            result.cancel()
+            raise
+        except Exception as exc: # Испорченное изображение не должно останавливать конвейер: ошибка передается загрузчику
+            if not result.done():
+                result.set_exception(exc)
+        else:
+            if not result.done(): # Загрузчик мог быть уже отменен
+                result.set_result(size)
+            if verbose:
+                print(cc, f'thumbnail {size} bytes')
+        finally:
+            queue.task_done()
+
+async def download_one(client: httpx.AsyncClient,
+                       metrics: Metrics,
+                       cc: str,
+                       base_url: str,
+                       semaphore: asyncio.Semaphore,
+                       queue: asyncio.Queue,
+                       verbose: bool) -> DownloadStatus:
+    t0 = time.perf_counter()
+    try:
+        async with semaphore:
+            metrics.emit('queue_wait', cc, time.perf_counter() - t0)
+            image = await get_flag(client, metrics, base_url, cc)
+    except httpx.HTTPStatusError as exc:
+        res = exc.response
+        if res.status_code == HTTPStatus.NOT_FOUND:
+            status = DownloadStatus.NOT_FOUND
+            msg = f'not found: {res.url}'
+        else:
+            raise
+    else:
+        result = asyncio.get_running_loop().create_future()
+        await queue.put((cc, image, result)) # Семафор уже освобожден: ожидание места в очереди не держит слот загрузки
+        try:
+            await result # Итоговый статус известен только после обработки изображения
+        except Exception as exc:
+            metrics.emit('postprocess_error', cc, repr(exc))
+            status = DownloadStatus.ERROR
+            msg = f'post-processing error: {exc!r}'
+        else:
+            status = DownloadStatus.OK
+            msg = 'OK'
+    if verbose and msg:
+        print(cc, msg)
+    return status
+
+async def supervisor(cc_list: list[str],
+                     base_url: str,
+                     verbose: bool,
+                     concur_req: int,
+                     metrics: Metrics) -> Counter[DownloadStatus]:
+    counter: Counter[DownloadStatus] = Counter()
+    semaphore = asyncio.Semaphore(concur_req)
+    to_do: list[asyncio.Task] = []
+    processors: list[asyncio.Task] = []
+    pool = ProcessPoolExecutor() # Без with: выход из него ждал бы завершения дочерних процессов, блокируя цикл событий
+    try:
+        workers = pool._max_workers # Незадокументированный атрибут, как в главе 20
+        queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_DEPTH * workers)
+        processors.extend(asyncio.create_task(post_process(queue, pool, verbose)) for _ in range(workers))
+        async with make_async_client(TokenBucket(RATE_LIMIT), concur_req) as client:
+            to_do.extend(asyncio.create_task(download_one(client, metrics, cc, base_url, semaphore, queue, verbose))
+                         for cc in sorted(cc_list))
+            for coro in asyncio.as_completed(to_do):
+                try:
+                    status = await coro
+                except httpx.HTTPError as exc:
+                    status = DownloadStatus.ERROR
+                    if verbose:
+                        print(f'{Path(str(exc.request.url)).stem.upper()} error: {exc}')
+                counter[status] += 1
+        await queue.join() # Дождаться обработки всех изображений, оставшихся в очереди
+    finally: # При ошибке или отмене остановить и загрузки, и обработчики, не блокируя цикл событий
+        for task in (*processors, *to_do):
+            task.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+        await asyncio.gather(*processors, *to_do, return_exceptions=True)
+    return counter
+
+if __name__ == '__main__':
+    main(download_many, DEFAULT_CONCUR_REQ, MAX_CONCUR_REQ) # main и download_many - из раздела о метриках
+
+# Возобновляемая загрузка с журналом заданий
+'''
+Если download_many прервать (супервизор даже перехватывает KeyboardInterrupt и выходит из цикла), то следующий запуск
+начнет все сначала. Журнал заданий в базе SQLite хранит состояние каждого кода страны: перед загрузкой записывается
+IN_PROGRESS, после - итоговое имя DownloadStatus. При повторном запуске страны в состоянии OK или NOT_FOUND пропускаются,
+а IN_PROGRESS (прерванные) и ERROR загружаются снова.
+Итоговый статус записывается, только когда download_one вернет управление, а она ждет, пока обработчик из пула
+сохранит миниатюру. Поэтому OK в журнале означает, что файл уже записан. Изображение, которое к моменту прерывания
+лежало в очереди или обрабатывалось, остается IN_PROGRESS или ERROR, как и сбой обработки, и будет загружено снова.
+Модуль sqlite3 синхронный, но каждая запись - это одна короткая транзакция по первичному ключу, а в режиме WAL
+с synchronous=NORMAL она не ждет fsync, так что вызывать его прямо из сопрограммы допустимо.
+'''
+
+import sqlite3
+
+JOURNAL_PATH = Path('downloads.sqlite3')
+DONE_STATUSES = (DownloadStatus.OK.name, DownloadStatus.NOT_FOUND.name)
+
+class JobJournal:
+
+    def __init__(self, path: Path = JOURNAL_PATH):
+        self.db = sqlite3.connect(path, isolation_level=None) # Режим автофиксации: каждая запись сразу попадает в журнал
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS jobs (cc TEXT PRIMARY KEY, status TEXT NOT NULL, updated REAL NOT NULL)')
+
+    def pending(self, cc_list: list[str]) -> list[str]:
+        '''Вернуть коды из cc_list, которые еще не загружены, сохраняя их порядок'''
+        placeholders = ', '.join('?' * len(DONE_STATUSES))
+        done = {cc for cc, in self.db.execute(f'SELECT cc FROM jobs WHERE status IN ({placeholders})', DONE_STATUSES)}
+        return [cc for cc in cc_list if cc not in done]
+
+    def mark(self, cc: str, status: str) -> None:
+        self.db.execute('INSERT OR REPLACE INTO jobs (cc, status, updated) VALUES (?, ?, ?)', (cc, status, time.time()))
+
+    def close(self) -> None:
+        self.db.close()
+
+async def journaled(journal: JobJournal, cc: str, download: typing.Awaitable[DownloadStatus]) -> DownloadStatus:
+    '''Обернуть объект сопрограммы download_one записями в журнал до загрузки и после обработки изображения'''
+    journal.mark(cc, 'IN_PROGRESS')
+    try:
+        status = await download
+    except BaseException: # Ошибка или отмена: задание будет повторено при следующем запуске
+        journal.mark(cc, DownloadStatus.ERROR.name)
+        raise
+    journal.mark(cc, status.name)
+    return status
+
+async def supervisor(cc_list: list[str],
+                     base_url: str,
+                     verbose: bool,
+                     concur_req: int,
+                     metrics: Metrics) -> Counter[DownloadStatus]:
+    counter: Counter[DownloadStatus] = Counter()
+    semaphore = asyncio.Semaphore(concur_req)
+    journal = JobJournal()
+    pending = journal.pending(sorted(cc_list))
+    if skipped := len(cc_list) - len(pending):
+        print(f'{skipped} already downloaded, resuming with {len(pending)}')
+    to_do: list[asyncio.Task] = []
+    processors: list[asyncio.Task] = []
+    pool = ProcessPoolExecutor() # Без with: выход из него ждал бы завершения дочерних процессов, блокируя цикл событий
+    try:
+        workers = pool._max_workers
+        queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_DEPTH * workers)
+        processors.extend(asyncio.create_task(post_process(queue, pool, verbose)) for _ in range(workers))
+        async with make_async_client(TokenBucket(RATE_LIMIT), concur_req) as client:
+            to_do.extend(asyncio.create_task(journaled(journal, cc, download_one(client, metrics, cc, base_url,
+                                                                                 semaphore, queue, verbose)))
+                         for cc in pending)
+            for coro in asyncio.as_completed(to_do):
+                try:
+                    status = await coro
+                except httpx.HTTPError as exc:
+                    status = DownloadStatus.ERROR
+                    if verbose:
+                        print(f'{Path(str(exc.request.url)).stem.upper()} error: {exc}')
+                except KeyboardInterrupt: # Как в первом супервизоре: прекратить загрузку, остальное сделает finally
+                    break
+                counter[status] += 1
+            else: # Цикл не прерывали - дождаться обработки изображений, оставшихся в очереди
+                await queue.join()
+    finally: # И при нормальном завершении, и при ошибке, отмене или KeyboardInterrupt
+        for task in (*processors, *to_do): # Отменить незавершенные загрузки, пока журнал открыт: каждая запишет ERROR
+            task.cancel()
+        pool.shutdown(wait=False, cancel_futures=True) # Не ждать дочерние процессы и отбросить еще не начатые миниатюры
+        await asyncio.gather(*processors, *to_do, return_exceptions=True)
+        journal.close() # Даже при прерывании уже сделанные записи сохранены: каждая фиксировалась сразу
+    return counter
+
+if __name__ == '__main__':
+    main(download_many, DEFAULT_CONCUR_REQ, MAX_CONCUR_REQ)
+
 # Написание асинхронных серверов
 
 import sys
@@ -490,6 +1302,225 @@ async def main(tld: str) -> None:
 if __name__ == '__main__':
     asyncio.run(main('net'))
 
+# Движок проверки доменов: ограничение конкурентности, кеш и отдельный исполнитель
+'''
+multi_probe запускает loop.getaddrinfo сразу для всех доменов. Сам getaddrinfo блокирующий, поэтому asyncio выполняет его
+в исполнителе по умолчанию - пуле потоков, который разделяется со всеми вызовами run_in_executor(None, ...) и to_thread.
+Большой список доменов затопляет этот пул, а при каждом запуске скрипта все имена разрешаются заново.
+ProbeEngine исправляет это так:
+> семафор ограничивает число одновременных запросов к DNS;
+> запросы выполняются в собственном ThreadPoolExecutor того же размера, так что остальной код не ждет очереди в пуле;
+> результаты кешируются: найденные имена на positive_ttl секунд, ненайденные - на negative_ttl (отрицательный кеш);
+  кеш сохраняется в JSON-файл и переживает перезапуск;
+> одновременные запросы одного и того же имени объединяются в один. Поиск выполняет задача, принадлежащая движку, а
+  запросившие сопрограммы ждут ее через asyncio.shield, поэтому отмена одной из них не отменяет поиск для остальных;
+> multi_probe не создает сопрограммы сразу для всех доменов: пул из concurrency рабочих берет домены из итератора по
+  одному, а результаты передает через ограниченную очередь;
+> распознаватель (resolver) подключаемый: любой объект с методом-сопрограммой resolve. Если распознаватель знает TTL записи,
+  он возвращает его вместе с результатом, и движок использует это значение вместо TTL по умолчанию. В тестах вместо DNS
+  можно подставить StaticResolver, работающий в том же процессе.
+'''
+
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+PROBE_CONCURRENCY = 32
+POSITIVE_TTL = 3600.0
+NEGATIVE_TTL = 300.0
+PROBE_CACHE_PATH = Path('probe_cache.json')
+
+class Resolver(typing.Protocol):
+    async def resolve(self, domain: str) -> tuple[bool, float | None]: ... # (найдено ли имя, TTL или None)
+
+class ExecutorResolver:
+    '''Разрешает имена через socket.getaddrinfo в отдельном пуле потоков'''
+
+    def __init__(self, max_workers: int = PROBE_CONCURRENCY):
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='resolver')
+
+    async def resolve(self, domain: str) -> tuple[bool, float | None]:
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, socket.getaddrinfo, domain, None)
+        except socket.gaierror:
+            return False, None
+        return True, None # getaddrinfo не сообщает TTL записи
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class StaticResolver:
+    '''Распознаватель-заглушка: имена из known считаются существующими, задержка delay имитирует сеть'''
+
+    def __init__(self, known: Iterable[str], delay: float = 0.0, ttl: float | None = None):
+        self.known = set(known)
+        self.delay = delay
+        self.ttl = ttl
+        self.calls = 0 # Позволяет в тестах убедиться, что кеш работает
+
+    async def resolve(self, domain: str) -> tuple[bool, float | None]:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return domain in self.known, self.ttl
+
+    def close(self) -> None:
+        pass
+
+class ProbeEngine:
+
+    def __init__(self,
+                 resolver: Resolver | None = None,
+                 concurrency: int = PROBE_CONCURRENCY,
+                 positive_ttl: float = POSITIVE_TTL,
+                 negative_ttl: float = NEGATIVE_TTL,
+                 cache_path: Path | None = PROBE_CACHE_PATH):
+        self.resolver = ExecutorResolver(concurrency) if resolver is None else resolver
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.cache_path = cache_path
+        self.cache: dict[str, tuple[bool, float]] = {} # domain -> (found, момент истечения по time.time())
+        self.pending: dict[str, asyncio.Task[Result]] = {}
+        if cache_path is not None and cache_path.exists():
+            now = time.time()
+            self.cache = {domain: (found, expires)
+                          for domain, (found, expires) in json.loads(cache_path.read_text()).items()
+                          if expires > now}
+
+    async def probe(self, domain: str) -> Result:
+        if (entry := self.cache.get(domain)) and entry[1] > time.time():
+            return Result(domain, entry[0]) # Попадание в кеш: ни семафор, ни пул потоков не нужны
+        if (task := self.pending.get(domain)) is None: # Это имя еще никто не разрешает - запустить поиск
+            task = asyncio.create_task(self.__lookup(domain))
+            self.pending[domain] = task
+            task.add_done_callback(functools.partial(self.__lookup_done, domain))
+        return await asyncio.shield(task) # Отменяется только ожидание этой сопрограммы, а не сам поиск
+
+    async def __lookup(self, domain: str) -> Result:
+        async with self.semaphore:
+            found, ttl = await self.resolver.resolve(domain)
+        if ttl is None:
+            ttl = self.positive_ttl if found else self.negative_ttl
+        self.cache[domain] = (found, time.time() + ttl)
+        return Result(domain, found)
+
+    def __lookup_done(self, domain: str, task: asyncio.Task[Result]) -> None:
+        del self.pending[domain]
+        if not task.cancelled():
+            task.exception() # Пометить исключение как полученное, даже если все ожидавшие это имя уже отменены
+
+    async def multi_probe(self, domains: Iterable[str]) -> AsyncIterator[Result]:
+        source = iter(domains)
+        results: asyncio.Queue[Result | Exception | None] = asyncio.Queue(self.concurrency)
+
+        async def worker() -> None:
+            try:
+                for domain in source: # Рабочие берут домены из общего итератора, так что каждый домен достается одному из них
+                    await results.put(await self.probe(domain))
+            except Exception as exc: # Ошибка передается потребителю через ту же очередь
+                await results.put(exc)
+            else:
+                await results.put(None) # Источник исчерпан - этот рабочий закончил
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            active = len(workers)
+            while active:
+                item = await results.get()
+                if item is None:
+                    active -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally: # Потребитель прекратил обход или произошла ошибка - остановить рабочих
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def close(self) -> None:
+        for task in self.pending.values():
+            task.cancel()
+        self.resolver.close()
+        if self.cache_path is not None:
+            self.cache_path.write_text(json.dumps(self.cache))
+
+    async def __aenter__(self) -> 'ProbeEngine':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+async def main(tld: str) -> None:
+    tld = tld.strip('.')
+    names = (kw for kw in kwlist if len(kw) <= 4)
+    domains = (f'{name}.{tld}'.lower() for name in names)
+    print('FOUND\t\tNOT FOUND')
+    print('=====\t\t=========')
+    async with ProbeEngine() as engine: # При повторном запуске в пределах TTL ответы берутся из probe_cache.json
+        async for domain, found in engine.multi_probe(domains):
+            indent = '' if found else '\t\t'
+            print(f'{indent}{domain}')
+
+if __name__ == '__main__':
+    asyncio.run(main('net'))
+
+# Потоковая генерация кандидатов с ограничением числа активных проверок
+'''
+multi_probe строит список coros сразу для всех доменов, поэтому все объекты сопрограмм существуют еще до получения первого
+результата. Для kwlist это не важно, но если генерировать миллионы кандидатов (все слова длиной не более N, умноженные
+на множество доменов верхнего уровня), то память закончится раньше, чем DNS-запросы.
+stream_probe берет домены из итератора лениво и держит активными не более limit проверок: новая задача создается, только
+когда завершилась одна из предыдущих. Поскольку stream_probe - асинхронный генератор, он приостанавливается на yield, пока
+потребитель не запросит следующий результат, и в это время не берет новых доменов из источника - это обратное давление.
+Потребление памяти не зависит от размера входных данных.
+'''
+
+import itertools
+from string import ascii_lowercase
+
+MAX_IN_FLIGHT = 100
+
+def candidates(max_len: int, tlds: Iterable[str]) -> Iterator[str]:
+    '''Генератор всех имен из латинских букв длиной от 1 до max_len в каждом из доменов tlds'''
+    for tld in tlds:
+        for length in range(1, max_len + 1):
+            for letters in itertools.product(ascii_lowercase, repeat=length):
+                yield f'{"".join(letters)}.{tld}'
+
+async def stream_probe(domains: Iterable[str],
+                       limit: int = MAX_IN_FLIGHT,
+                       probe: typing.Callable[[str], typing.Awaitable[Result]] = probe) -> AsyncIterator[Result]:
+    '''Вместо функции probe можно передать метод engine.probe объекта ProbeEngine, чтобы получить кеш и отдельный исполнитель'''
+    source = iter(domains)
+    in_flight: set[asyncio.Task[Result]] = set()
+    try:
+        while True:
+            for domain in itertools.islice(source, limit - len(in_flight)): # Дополнить число активных задач до limit
+                in_flight.add(asyncio.create_task(probe(domain)))
+            if not in_flight: # Источник исчерпан, и все задачи завершены
+                break
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally: # Потребитель прекратил обход (break или aclose()) - не оставлять висящих задач
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True) # Дождаться, пока отмена дойдет до каждой задачи
+
+async def main(max_len: int, tlds: list[str]) -> None:
+    found = 0
+    async with ProbeEngine() as engine:
+        async for domain, exists in stream_probe(candidates(max_len, tlds), probe=engine.probe):
+            if exists:
+                found += 1
+                print(domain)
+    print(f'{found} found')
+
+if __name__ == '__main__':
+    asyncio.run(main(2, ['dev', 'net']))
+
 # Асинхронные генераторы в качестве контекстных менеджеров
 '''
 Если есть необходимость написать свой асинхронный контекстный менеджер, можно использовать 
@@ -167,6 +167,274 @@ class FrozenJSON:
 а объект, построенный классом object, является экземпляром класса FrozenJSON.
 '''
 
+# Ленивый FrozenJSON: разбор по требованию
+'''
+Все три версии FrozenJSON требуют, чтобы json.load сначала построил в памяти весь документ, а __getattr__ при каждом
+обращении заново оборачивает дочерние значения: выражение feed.Schedule.events[40] строит обертки для всего списка
+events. Для ленты размером в несколько гигабайт это неприемлемо.
+LazyFrozenJSON работает с файлом, отображенным в память (mmap), и ничего не разбирает заранее. Объект помнит только
+позицию своей открывающей скобки. При обращении к атрибуту он просматривает свои члены с того места, где остановился в
+прошлый раз, до нужного ключа и запоминает, где начинаются значения. Вложенные объекты и массивы пропускаются без
+декодирования: регулярное выражение JSON_SKIP пропускает все до ближайшей скобки, не заходя внутрь строк (в них тоже
+могут быть скобки), а глубина вложенности считается в цикле. Скалярное значение декодируется json.loads только при обращении к нему.
+Конец найденного значения ищется, только если просмотр придется продолжить: обращение к feed.Schedule не требует
+пропускать весь Schedule. Построенные дочерние объекты и значения запоминаются в __cache, поэтому повторное обращение
+ничего не стоит.
+Модуль json стандартной библиотеки не умеет разбирать документ по частям, поэтому пропуск значений реализован вручную;
+декодирование строк и чисел по-прежнему выполняет json.loads.
+Расход памяти пропорционален тому, к чему было обращение: для затронутого массива хранятся начала элементов вплоть до
+наибольшего запрошенного индекса (отрицательный индекс и len требуют просмотра всего массива).
+LazyFrozenJSON.open возвращает LazyList, если документ - массив, и само значение, если документ - скаляр. Отображение
+закрывается методом close() или при выходе из блока with; после этого ни один объект документа читать нельзя.
+Если ключ в объекте повторяется, json.loads оставляет последнее значение, а LazyFrozenJSON - первое: иначе, чтобы
+вернуть любое значение, пришлось бы просматривать объект до конца. Стандарт JSON (RFC 8259) поведение в этом случае
+не определяет, но документы с повторяющимися ключами эти две версии читают по-разному.
+'''
+
+import mmap
+import re
+
+JSON_WS = re.compile(rb'[ \t\n\r]*')
+JSON_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+JSON_SKIP = re.compile(rb'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.DOTALL) # Все до ближайшей скобки вне строки
+JSON_SCALAR = re.compile(rb'[^,\]}\s]+')
+
+def skip_ws(buf, pos: int) -> int:
+    return JSON_WS.match(buf, pos).end()
+
+def value_end(buf, pos: int) -> int:
+    '''Вернуть позицию сразу за значением JSON, которое начинается в позиции pos, не декодируя это значение'''
+    first = buf[pos]
+    if first == ord('"'):
+        return JSON_STRING.match(buf, pos).end()
+    if first not in b'{[':
+        return JSON_SCALAR.match(buf, pos).end()
+    depth = 0
+    while pos < len(buf):
+        depth += 1 if buf[pos] in b'{[' else -1
+        pos += 1
+        if depth == 0:
+            return pos
+        pos = JSON_SKIP.match(buf, pos).end() # Цикл Python выполняется только для скобок, остальное пропускает re
+    raise ValueError('unterminated JSON value')
+
+def next_item(buf, start: int) -> int:
+    '''Пропустить значение, начинающееся в start, и следующую за ним запятую'''
+    pos = skip_ws(buf, value_end(buf, start))
+    if buf[pos] == ord(','):
+        pos = skip_ws(buf, pos + 1)
+    return pos
+
+def materialize(buf, start: int):
+    first = buf[start]
+    if first == ord('{'):
+        return LazyFrozenJSON(buf, start)
+    if first == ord('['):
+        return LazyList(buf, start)
+    return json.loads(buf[start:value_end(buf, start)])
+
+class LazyFrozenJSON:
+    '''Допускающий только чтение фасад для JSON-объекта, который разбирается по мере обращения к атрибутам'''
+
+    __slots__ = ('__buf', '__pos', '__last', '__starts', '__cache')
+
+    def __init__(self, buf, start: int = 0):
+        self.__buf = buf # bytes или mmap; start - позиция открывающей фигурной скобки
+        self.__pos = skip_ws(buf, start + 1) # Где продолжить просмотр членов; None - объект просмотрен до конца
+        self.__last = None # Начало последнего найденного значения: его конец ищется, только если просмотр продолжится
+        self.__starts = {} # Ключ (с добавленным _, если это зарезервированное слово) -> начало значения в buf
+        self.__cache = {}
+
+    @classmethod
+    def open(cls, path):
+        '''Отобразить файл в память и вернуть фасад для документа: LazyFrozenJSON, LazyList или скалярное значение'''
+        with open(path, 'rb') as fp:
+            buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) # Отображение остается доступным после закрытия файла
+        start = skip_ws(buf, 0)
+        if buf[start] == ord('{'):
+            return cls(buf, start)
+        document = materialize(buf, start)
+        if not isinstance(document, LazyList): # Скаляр уже декодирован - отображение больше не нужно
+            buf.close()
+        return document
+
+    def close(self) -> None:
+        '''Закрыть отображение файла, общее для всех объектов документа'''
+        if isinstance(self.__buf, mmap.mmap):
+            self.__buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __scan(self, wanted=None) -> None:
+        '''Просмотреть члены объекта, начиная с места прошлой остановки, до ключа wanted или до конца объекта'''
+        buf, starts = self.__buf, self.__starts
+        pos = self.__pos if self.__last is None else next_item(buf, self.__last)
+        self.__last = None
+        while pos is not None:
+            if buf[pos] == ord('}'):
+                pos = None
+                break
+            key_end = JSON_STRING.match(buf, pos).end()
+            key = json.loads(buf[pos:key_end])
+            if keyword.iskeyword(key):
+                key += '_'
+            start = skip_ws(buf, skip_ws(buf, key_end) + 1) # Пропустить двоеточие
+            starts.setdefault(key, start) # Повторяющийся ключ: остается первое значение
+            if key == wanted:
+                self.__last = start
+                break
+            pos = next_item(buf, start)
+        self.__pos = pos
+
+    def __getattr__(self, name):
+        try:
+            return self.__cache[name]
+        except KeyError:
+            pass
+        if name not in self.__starts:
+            self.__scan(name)
+        try:
+            start = self.__starts[name]
+        except KeyError:
+            raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}') from None
+        value = self.__cache[name] = materialize(self.__buf, start)
+        return value
+
+    def keys(self):
+        self.__scan()
+        return self.__starts.keys()
+
+    def items(self):
+        return ((key, getattr(self, key)) for key in self.keys())
+
+    def __dir__(self):
+        return self.keys()
+
+class LazyList(abc.Sequence):
+    '''Массив JSON, элементы которого разбираются по мере обращения к ним'''
+
+    __slots__ = ('__buf', '__pos', '__last', '__starts', '__cache')
+
+    def __init__(self, buf, start: int):
+        self.__buf = buf
+        self.__pos = skip_ws(buf, start + 1)
+        self.__last = None
+        self.__starts = [] # Начала уже найденных элементов
+        self.__cache = {} # Индекс -> построенный элемент
+
+    def close(self) -> None:
+        if isinstance(self.__buf, mmap.mmap):
+            self.__buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __scan(self, upto=None) -> None:
+        '''Просмотреть элементы, пока не станет известно начало элемента с индексом upto (или до конца массива)'''
+        buf, starts = self.__buf, self.__starts
+        pos = self.__pos if self.__last is None else next_item(buf, self.__last)
+        self.__last = None
+        while pos is not None:
+            if buf[pos] == ord(']'):
+                pos = None
+                break
+            starts.append(pos)
+            if upto is not None and len(starts) > upto:
+                self.__last = pos
+                break
+            pos = next_item(buf, pos)
+        self.__pos = pos
+
+    def __len__(self):
+        self.__scan()
+        return len(self.__starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        try:
+            return self.__cache[index]
+        except KeyError:
+            pass
+        if index >= len(self.__starts):
+            self.__scan(index)
+        if not 0 <= index < len(self.__starts):
+            raise IndexError('LazyList index out of range')
+        value = self.__cache[index] = materialize(self.__buf, self.__starts[index])
+        return value
+
+with LazyFrozenJSON.open('data/osconfeed.json') as lazy_feed:
+    print(lazy_feed.Schedule.events[40].name) # Разобраны только начало Schedule и первые 41 элемент events
+    print(lazy_feed.Schedule.events[40] is lazy_feed.Schedule.events[40]) # True: дочерние объекты запоминаются
+
+# explore3.py: FrozenJSON с кешем дочерних объектов, __slots__ и кешем преобразования ключей
+'''
+Во всех трех версиях FrozenJSON выше каждое обращение к атрибуту строит новые обертки: feed.Schedule.speakers в цикле
+каждый раз создает список из сотен объектов FrozenJSON, а __init__ для каждого из них заново вызывает keyword.iskeyword
+для всех ключей и копирует отображение ключ за ключом.
+> Построенные дочерние значения запоминаются в словаре __cache экземпляра, поэтому повторное обращение - это один поиск
+  в словаре. Списки возвращаются в виде кортежей: один и тот же объект отдается всем, и изменять его нельзя.
+> Записи в JSON-ленте однотипны: у всех докладчиков одинаковый набор ключей. Результат преобразования ключей кешируется
+  по кортежу исходных ключей в functools.lru_cache ограниченного размера (KEY_LAYOUT_CACHE_SIZE), чтобы документ с
+  множеством разных наборов ключей не раздувал кеш. Если среди ключей нет зарезервированных слов, кеш возвращает None,
+  и исходный словарь используется без копирования - фасад все равно только читает его.
+> __slots__ убирает словарь __dict__ из каждого экземпляра: объектов-оберток становится много, и память на них важна.
+'''
+
+import functools
+
+KEY_LAYOUT_CACHE_SIZE = 1024
+
+class FrozenJSON:
+
+    __slots__ = ('__data', '__cache')
+
+    def __new__(cls, arg):
+        if isinstance(arg, abc.Mapping):
+            return super().__new__(cls)
+        elif isinstance(arg, abc.MutableSequence):
+            return tuple(cls(item) for item in arg)
+        else:
+            return arg
+
+    @staticmethod
+    @functools.lru_cache(maxsize=KEY_LAYOUT_CACHE_SIZE)
+    def __key_layout(keys):
+        '''Кортеж ключей с добавленным _ у зарезервированных слов или None, если менять нечего'''
+        layout = tuple(key + '_' if keyword.iskeyword(key) else key for key in keys)
+        return None if layout == keys else layout
+
+    def __init__(self, mapping):
+        layout = self.__key_layout(tuple(mapping))
+        self.__data = mapping if layout is None else dict(zip(layout, mapping.values()))
+        self.__cache = {}
+
+    def __getattr__(self, name):
+        try:
+            return self.__cache[name]
+        except KeyError:
+            pass
+        try:
+            return getattr(self.__data, name)
+        except AttributeError:
+            value = self.__cache[name] = type(self)(self.__data[name])
+            return value
+
+    def __dir__(self):
+        return self.__data.keys()
+
+feed = FrozenJSON(json.load(open('data/osconfeed.json')))
+print(feed.Schedule.speakers is feed.Schedule.speakers) # True: кортеж оберток построен один раз
+
 # Вычисляемые свойства
 # Шаг 1: создание управляемого данными атрибута
 import json
@@ -270,13 +538,337 @@ def load(path=JSON_PATH):
             records[key] = factory(**raw_record) # ... объект, сохраняемый в records, конструируется функцией factory,
                                                  # которая может быть конструктором Record или его подкласса - в зависимости
                                                  # от значения record_type
-        return records
+    return records
 
 '''
 При вычислении obj.my_attr интерпретатор сначала смотрит на класс obj. Если в классе имеется свойство с именем my_attr, 
 то оно маскирует одноименный атрибут экземпляра. 
 '''
 
+# Двоичный снимок загруженных записей
+'''
+load() при каждом запуске заново разбирает osconfeed.json и строит каждый объект Record через __dict__.update, а первый
+вызов Record.fetch неявно запускает эту загрузку. load_cached сохраняет готовый словарь записей в файл снимка рядом с
+исходным файлом (pickle с протоколом HIGHEST_PROTOCOL) и при следующих запусках читает его, минуя разбор JSON.
+При распаковке pickle не вызывает __init__: состояние каждого объекта сразу записывается в его __dict__.
+В заголовке снимка хранятся время модификации (в наносекундах) и размер исходного файла, а также отпечаток схемы:
+хеш от SNAPSHOT_VERSION и списка классов записей в Record.registry. Если хоть что-то из этого не совпадает - изменилась
+лента, появился новый подкласс (например, Speaker) или версия увеличена вручную после изменения классов, - снимок
+считается устаревшим и строится заново. Ошибка распаковки (переименованный или удаленный класс, испорченный файл)
+тоже означает лишь промах кеша. Файл снимка отображается в память, и pickle.loads читает
+данные прямо из отображения через memoryview, без промежуточной копии. Новый снимок сначала пишется во временный
+файл, а затем подменяет старый через os.replace; поэтому другой процесс никогда не увидит наполовину записанный снимок.
+Снимок - это pickle, поэтому он годится только как локальный кеш: загружать чужие файлы pickle небезопасно.
+'''
+
+import gc
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+
+SNAPSHOT_SUFFIX = '.snapshot'
+SNAPSHOT_MAGIC = b'RSN2'
+SNAPSHOT_VERSION = 1 # Увеличить, если изменилось устройство классов записей, а их имена - нет
+SNAPSHOT_HEADER = struct.Struct('<4sQQ16s') # Сигнатура, st_mtime_ns и st_size исходного файла, отпечаток схемы
+
+def snapshot_schema() -> bytes:
+    classes = sorted((record_type, cls.__module__, cls.__qualname__) for record_type, cls in Record.registry.items())
+    return hashlib.blake2b(repr((SNAPSHOT_VERSION, classes)).encode(), digest_size=16).digest()
+
+def snapshot_signature(path) -> tuple[bytes, int, int, bytes]:
+    stat = os.stat(path)
+    return SNAPSHOT_MAGIC, stat.st_mtime_ns, stat.st_size, snapshot_schema()
+
+def save_snapshot(records, path=JSON_PATH, suffix=SNAPSHOT_SUFFIX) -> None:
+    snapshot = os.fspath(path) + suffix
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(snapshot) or '.', suffix='.tmp') # Уникальное имя: снимок могут
+                                                                                   # строить сразу несколько процессов
+    try:
+        with open(fd, 'wb') as fp:
+            fp.write(SNAPSHOT_HEADER.pack(*snapshot_signature(path)))
+            pickle.dump(records, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, snapshot)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def read_snapshot(path=JSON_PATH, suffix=SNAPSHOT_SUFFIX):
+    '''Вернуть записи из снимка или None, если снимка нет, он устарел или не распаковывается'''
+    try:
+        fp = open(os.fspath(path) + suffix, 'rb')
+    except FileNotFoundError:
+        return None
+    with fp:
+        if os.fstat(fp.fileno()).st_size <= SNAPSHOT_HEADER.size:
+            return None
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if SNAPSHOT_HEADER.unpack_from(mm) != snapshot_signature(path):
+                return None
+            gc_enabled = gc.isenabled()
+            gc.disable() # Распаковка создает сотни тысяч объектов, и сборщик мусора напрасно обходил бы их снова и снова
+            try:
+                with memoryview(mm) as view, view[SNAPSHOT_HEADER.size:] as payload: # Освободить буфер до закрытия mmap
+                    return pickle.loads(payload)
+            except Exception: # Класс переименован или удален, файл испорчен - испорченный pickle может
+                return None       # вызвать почти любое исключение, а не только UnpicklingError
+            finally:
+                if gc_enabled:
+                    gc.enable()
+
+def load_cached(path=JSON_PATH, loader=None, suffix=SNAPSHOT_SUFFIX):
+    '''Вернуть результат loader(path) (по умолчанию - словарь записей от load) из снимка или построить его заново.
+    Для каждого loader нужен свой суффикс файла снимка.'''
+    records = read_snapshot(path, suffix)
+    if records is None:
+        records = (load if loader is None else loader)(path)
+        try:
+            save_snapshot(records, path, suffix)
+        except OSError: # Каталог только для чтения или диск заполнен: снимок - лишь кеш, записи уже загружены
+            pass
+    return records
+
+# Вторичные индексы и запросы к расписанию
+'''
+load() строит плоский словарь {'speaker.3471': Record, ...}: по ключу запись находится сразу, но на вопросы "все
+выступления докладчика", "все события в зале" и "события в заданном интервале времени" можно ответить только
+полным перебором. Schedule хранит тот же словарь записей и вторичные индексы, объявленные в атрибутах класса:
+> hash_indexes: имя индекса -> (тип записи, поле). Значение поля становится ключом словаря, а запись добавляется в
+  кортеж записей с этим значением; если поле - список (как speakers у события), запись попадает в индекс по каждому
+  элементу. Поиск - O(1).
+> sorted_indexes: имя индекса -> (тип записи, поле). Записи упорядочиваются по значению поля, а значения хранятся в
+  отдельном отсортированном списке, по которому bisect находит границы интервала за O(log n).
+Индексы строятся в том же проходе по ленте, в котором создаются записи: Schedule.parse передает каждую новую запись
+методу add, а seal в конце лишь сортирует накопленные пары (значение, ключ). Schedule.load сохраняет расписание вместе с
+готовыми индексами в снимок (см. load_cached), так что при следующем запуске не нужен ни разбор JSON, ни построение индексов.
+Поля читаются из __dict__ записи, а не через getattr: у Event свойство speakers подменяет список номеров записями, а
+индексу нужны именно номера. Время в ленте хранится строками вида '2014-07-23 17:00:00', которые сортируются
+в хронологическом порядке, поэтому границы интервалов задаются строками того же формата.
+Record здесь определен заново: его общий индекс - это расписание Schedule.load(), поэтому fetch и запросы к индексам
+возвращают одни и те же объекты. Остальные возможности этого Record - поколения для кешируемых связей, реестр подклассов
+и пакетное построение - описаны в следующих разделах.
+'''
+
+from bisect import bisect_left
+from collections import defaultdict
+
+SCHEDULE_SNAPSHOT_SUFFIX = '.schedule' + SNAPSHOT_SUFFIX
+
+class Record:
+
+    __schedule = None # Расписание Schedule: словарь записей и вторичные индексы
+    generation = 0 # Номер загрузки расписания; по нему кешируемые связи (Relation) узнают, что устарели
+    registry = {} # Тип записи -> подкласс Record; заполняется в __init_subclass__
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __init_subclass__(cls, record_type=None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        Record.registry[record_type or cls.__name__.lower()] = cls
+
+    @classmethod
+    def from_dicts(cls, raw_records):
+        '''Построить экземпляры cls из списка словарей, не распаковывая их в именованные аргументы'''
+        new = cls.__new__
+        records = []
+        for raw_record in raw_records:
+            record = new(cls)
+            record.__dict__ = raw_record
+            records.append(record)
+        return records
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} serial={self.serial!r}>'
+
+    @staticmethod
+    def fetch(key):
+        return Record.schedule().records[key]
+
+    @staticmethod
+    def schedule():
+        '''Общее расписание, через которое fetch находит связанные записи; загружается при первом обращении'''
+        if Record.__schedule is None:
+            Record.__schedule = Schedule.load()
+        return Record.__schedule
+
+    @staticmethod
+    def reload(path=JSON_PATH):
+        '''Загрузить расписание заново; кешированные связи всех записей становятся недействительными'''
+        Record.__schedule = Schedule.load(path)
+        Record.generation += 1
+
+class Schedule:
+
+    hash_indexes = {
+        'events_by_speaker': ('event', 'speakers'),
+        'events_by_venue': ('event', 'venue_serial'),
+    }
+    sorted_indexes = {
+        'events_by_start': ('event', 'time_start'),
+    }
+
+    def __init__(self):
+        self.records = {}
+        self.__hashed = {name: defaultdict(list) for name in self.hash_indexes}
+        self.__ordered = {name: [] for name in self.sorted_indexes} # Пары (значение, ключ) до вызова seal
+        self.__sorted = {}
+
+    @classmethod
+    def parse(cls, path=JSON_PATH):
+        '''Разобрать ленту, внося каждую запись в индексы сразу после ее создания'''
+        schedule = cls()
+        with open(path) as fp:
+            raw_data = json.load(fp)
+        for collection, raw_records in raw_data['Schedule'].items():
+            record_type = collection[:-1]
+            factory = Record.registry.get(record_type, Record)
+            for record in factory.from_dicts(raw_records):
+                schedule.add(f'{record_type}.{record.serial}', record)
+        schedule.seal()
+        return schedule
+
+    @classmethod
+    def load(cls, path=JSON_PATH):
+        return load_cached(path, cls.parse, SCHEDULE_SNAPSHOT_SUFFIX)
+
+    def add(self, key: str, record) -> None:
+        self.records[key] = record
+        record_type = key.partition('.')[0]
+        fields = vars(record)
+        for name, (indexed_type, field) in self.hash_indexes.items():
+            if indexed_type == record_type and field in fields:
+                values = fields[field] if isinstance(fields[field], list) else [fields[field]]
+                for value in values:
+                    self.__hashed[name][value].append(record)
+        for name, (indexed_type, field) in self.sorted_indexes.items():
+            if indexed_type == record_type and fields.get(field) is not None:
+                self.__ordered[name].append((fields[field], key))
+
+    def seal(self) -> None:
+        '''Завершить загрузку: упорядочить сортированные индексы и заморозить списки записей'''
+        self.__hashed = {name: {value: tuple(found) for value, found in index.items()}
+                         for name, index in self.__hashed.items()}
+        for name, entries in self.__ordered.items():
+            entries.sort()
+            self.__sorted[name] = ([value for value, _ in entries], [self.records[key] for _, key in entries])
+        self.__ordered = {name: [] for name in self.sorted_indexes}
+
+    def find(self, index: str, value) -> tuple:
+        '''Записи, у которых поле индекса index равно value'''
+        return self.__hashed[index].get(value, ())
+
+    def between(self, index: str, lo, hi) -> list:
+        '''Записи, у которых поле упорядоченного индекса index лежит в полуоткрытом интервале [lo, hi)'''
+        values, found = self.__sorted[index]
+        return found[bisect_left(values, lo):bisect_left(values, hi)]
+
+    def events_by_speaker(self, serial: int) -> tuple:
+        return self.find('events_by_speaker', serial)
+
+    def events_by_venue(self, serial: int) -> tuple:
+        return self.find('events_by_venue', serial)
+
+    def events_between(self, start: str, stop: str) -> list:
+        return self.between('events_by_start', start, stop)
+
+# schedule = Record.schedule()
+# print(schedule.events_by_speaker(3471))
+# print(schedule.events_between('2014-07-23 09:00:00', '2014-07-23 12:00:00'))
+
+# Кешируемые связи между записями
+'''
+Свойства venue и speakers класса Event при каждом обращении заново строят ключ f-строкой и вызывают fetch, а speakers
+к тому же каждый раз возвращает новый список. При выводе всего расписания эти свойства читаются тысячи раз.
+Relation - дескриптор связи: при первом обращении он находит связанные записи и сохраняет результат в __dict__ записи
+под отдельным именем (сырое поле, например speakers со списком номеров, остается нетронутым). Связь "ко многим"
+(many=True) возвращает кортеж, потому что один и тот же объект отдается при каждом обращении.
+Вместе с результатом запоминается поколение расписания Record.generation. Record.reload() загружает расписание заново и
+увеличивает поколение, после чего все кешированные связи считаются устаревшими и при следующем обращении находятся
+заново - обходить все записи для сброса кеша не нужно.
+Relation определяет __set__, то есть это дескриптор данных (как property): иначе одноименный атрибут экземпляра,
+например сырое поле speakers, маскировал бы его.
+'''
+
+class Relation:
+
+    def __init__(self, record_type: str, field: str, many: bool = False):
+        self.record_type = record_type # Префикс ключа связанной записи: 'venue', 'speaker'
+        self.field = field # Поле записи с номером (или списком номеров) связанных записей
+        self.many = many
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.storage = f'_{name}_relation' # Имя, под которым результат хранится в __dict__ записи
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        generation = owner.generation
+        cached = instance.__dict__.get(self.storage)
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+        try:
+            raw = instance.__dict__[self.field]
+        except KeyError: # У записи нет поля связи (например, venue_serial): для вызывающего кода это отсутствующий атрибут,
+                         # как и у свойства, - тогда работают getattr с умолчанием и hasattr
+            raise AttributeError(f'{type(instance).__name__!r} object has no attribute {self.field!r}') from None
+        fetch = owner.fetch
+        if self.many:
+            value = tuple(fetch(f'{self.record_type}.{serial}') for serial in raw)
+        else:
+            value = fetch(f'{self.record_type}.{raw}')
+        instance.__dict__[self.storage] = (generation, value)
+        return value
+
+    def __set__(self, instance, value):
+        raise AttributeError(f'{self.name!r} is a read-only relation')
+
+    def invalidate(self, instance) -> None:
+        '''Сбросить кеш связи одной записи (чтобы сбросить все связи сразу, есть Record.reload)'''
+        instance.__dict__.pop(self.storage, None)
+
+class Event(Record):
+
+    venue = Relation('venue', 'venue_serial')
+    speakers = Relation('speaker', 'speakers', many=True)
+
+    def __repr__(self):
+        try:
+            return f'<{self.__class__.__name__} {self.name!r}>'
+        except AttributeError:
+            return super().__repr__()
+
+# event = Record.fetch('event.33950')
+# print(event.speakers is event.speakers) # True: связь найдена один раз
+# Record.reload() # После перезагрузки индекса связь будет найдена заново
+
+# Реестр классов записей и пакетное построение
+'''
+load() выбирает класс для каждой коллекции через globals().get(cls_name, Record) с проверками inspect.isclass и
+issubclass, то есть зависит от того, какие имена оказались в глобальном пространстве имен модуля. В Record из раздела о
+вторичных индексах каждый подкласс регистрирует себя сам: метод __init_subclass__ вызывается при создании подкласса и
+записывает его в Record.registry под типом записи ('event' для Event; другой тип можно передать в заголовке класса: class Talk(Record, record_type='event')).
+Подкласс, определенный позже, замещает прежний - как и при поиске в globals().
+Record.from_dicts строит экземпляры пакетом: вместо factory(**raw_record), то есть распаковки словаря в именованные
+аргументы и повторной упаковки в kwargs, экземпляр создается методом __new__ без вызова __init__, а словарь, полученный от
+json.load, становится его __dict__ без копирования. Вызывающий код передает словари во владение записям.
+Так записи строит Schedule.parse; load ниже делает то же самое для плоского словаря записей, который кеширует load_cached.
+'''
+
+def load(path=JSON_PATH):
+    records = {}
+    with open(path) as fp:
+        raw_data = json.load(fp)
+    for collection, raw_records in raw_data['Schedule'].items():
+        record_type = collection[:-1]
+        factory = Record.registry.get(record_type, Record)
+        for record in factory.from_dicts(raw_records):
+            records[f'{record_type}.{record.serial}'] = record
+    return records
+
 # Дескриптор - это объект, который управляет доступом к атрибуту в другом классе.
 
 '''
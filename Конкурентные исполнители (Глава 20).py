@@ -144,6 +144,42 @@ def is_prime(n: int) -> bool:
             return False
     return True
 
+# Тест Миллера — Рабина (подробно разобран в главе 19): детерминирован для всех 64-разрядных чисел и работает
+# за микросекунды там, где проверке делением нужны секунды. is_prime остается эталонной реализацией.
+
+from collections.abc import Callable
+from typing import TypeAlias
+
+PrimeTest: TypeAlias = Callable[[int], bool]
+
+SIEVE_LIMIT = 100
+SIEVE_PRIMES = tuple(p for p in range(SIEVE_LIMIT) if is_prime(p))
+MR_BASES = SIEVE_PRIMES[:13] # 2, 3, 5, ..., 41: тест точен для всех n < 3.3 * 10**24
+
+def is_prime_mr(n: int) -> bool:
+    if n < 2:
+        return False
+    for p in SIEVE_PRIMES:
+        if n % p == 0:
+            return n == p
+    if n < SIEVE_LIMIT ** 2:
+        return True
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in MR_BASES:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
 NUMBERS = (2,
            142702110479723,
            299593572317531,
@@ -175,9 +211,9 @@ class PrimeResult(NamedTuple):
     flag: bool
     elapsed: float
 
-def check(n: int) -> PrimeResult:
+def check(n: int, test: PrimeTest = is_prime_mr) -> PrimeResult:
     t0 = time.perf_counter()
-    res = is_prime(n)
+    res = test(n)
     return PrimeResult(n, res, time.perf_counter() - t0)
 
 def main() -> None:
@@ -225,6 +261,629 @@ if __name__ == '__main__':
 работу, поэтому результаты появляются немедленно.
 '''
 
+# Сегментированное решето Эратосфена
+'''
+Драйверы выше проверяют числа по одному. Если нужны все простые числа в полуинтервале [a, b) или признаки простоты для
+миллионов соседних чисел, то вызывать is_prime для каждого числа бессмысленно дорого - решето Эратосфена вычеркивает
+кратные каждому простому числу срезом с шагом p, и эту работу выполняет код на C внутри bytearray.
+Чтобы не выделять память под весь интервал, он делится на сегменты по SEGMENT_SIZE чисел. Для вычеркивания в сегменте
+[lo, hi) достаточно базовых простых чисел до isqrt(hi - 1), которые вычисляются обычным решетом один раз.
+Признаки простоты хранятся в bytearray по байту на число: стандартная библиотека не имеет битового массива, а срезовое
+присваивание для bytearray работает быстрее, чем поразрядные операции над int.
+Сегменты независимы, поэтому их можно раздать процессам ProcessPoolExecutor.
+'''
+
+import itertools
+from collections import deque
+from collections.abc import Iterable, Iterator
+from functools import lru_cache
+
+SEGMENT_SIZE = 1 << 20 # Чисел в одном сегменте; примерно 1 Мбайт памяти на сегмент
+
+@lru_cache(maxsize=4) # В каждом процессе пула базовые простые числа вычисляются один раз для данного limit
+def base_primes(limit: int) -> tuple[int, ...]:
+    '''Все простые числа, не превосходящие limit (классическое решето)'''
+    if limit < 2:
+        return ()
+    flags = bytearray([1]) * (limit + 1)
+    flags[0] = flags[1] = 0
+    for p in range(2, math.isqrt(limit) + 1):
+        if flags[p]:
+            flags[p * p::p] = bytes(len(range(p * p, limit + 1, p)))
+    return tuple(itertools.compress(range(limit + 1), flags))
+
+def sieve_segment(lo: int, hi: int, limit: int | None = None) -> bytearray:
+    '''Вернуть bytearray flags длиной hi - lo, в котором flags[i] == 1 тогда и только тогда, когда lo + i - простое.
+    limit - верхняя граница базовых простых чисел; по умолчанию isqrt(hi - 1). При параллельной обработке всем сегментам
+    передается одно и то же значение, чтобы кеш base_primes срабатывал.'''
+    if hi <= max(lo, 2): # Пустой диапазон или диапазон целиком меньше 2 - простых нет, isqrt(hi - 1) может быть не определен
+        return bytearray(max(hi - lo, 0))
+    if limit is None:
+        limit = math.isqrt(hi - 1)
+    flags = bytearray([1]) * (hi - lo)
+    for p in base_primes(limit):
+        if p * p >= hi:
+            break
+        start = max(p * p, -(-lo // p) * p) # Первое кратное p, не меньшее lo; меньшие p * p уже вычеркнуты меньшими простыми
+        flags[start - lo::p] = bytes(len(range(start, hi, p)))
+    for n in range(lo, min(hi, 2)): # 0 и 1 - не простые
+        flags[n - lo] = 0
+    return flags
+
+def segments(a: int, b: int, size: int = SEGMENT_SIZE) -> Iterator[tuple[int, int]]:
+    for lo in range(a, b, size):
+        yield lo, min(lo + size, b)
+
+def primes_in_range(a: int, b: int, size: int = SEGMENT_SIZE) -> Iterator[int]:
+    '''Генератор простых чисел из [a, b) в порядке возрастания; в памяти одновременно находится один сегмент'''
+    a = max(a, 2) # Меньше 2 простых чисел нет
+    if b <= a:
+        return
+    limit = math.isqrt(b - 1)
+    for lo, hi in segments(a, b, size):
+        yield from itertools.compress(range(lo, hi), sieve_segment(lo, hi, limit))
+
+def parallel_segments(a: int,
+                      b: int,
+                      executor: futures.Executor,
+                      size: int = SEGMENT_SIZE,
+                      window: int | None = None) -> Iterator[tuple[int, bytearray]]:
+    '''Отдает пары (lo, flags) по порядку, вычисляя сегменты в пуле. В отличие от executor.map, который сразу планирует
+    все задачи, здесь запланировано не более window сегментов вперед, так что медленный потребитель не приводит
+    к накоплению результатов в памяти.'''
+    if window is None:
+        window = 2 * (getattr(executor, '_max_workers', None) or 1)
+    a = max(a, 2)
+    if b <= a:
+        return
+    limit = math.isqrt(b - 1)
+    pending: deque[tuple[int, futures.Future]] = deque()
+    for lo, hi in segments(a, b, size):
+        pending.append((lo, executor.submit(sieve_segment, lo, hi, limit)))
+        if len(pending) >= window:
+            lo, future = pending.popleft()
+            yield lo, future.result()
+    while pending:
+        lo, future = pending.popleft()
+        yield lo, future.result()
+
+def parallel_primes_in_range(a: int, b: int, executor: futures.Executor, size: int = SEGMENT_SIZE) -> Iterator[int]:
+    for lo, flags in parallel_segments(a, b, executor, size):
+        yield from itertools.compress(range(lo, lo + len(flags)), flags)
+
+def main() -> None:
+    a, b = 10**12, 10**12 + 10**8 # Сто миллионов чисел около триллиона
+    t0 = perf_counter()
+    with futures.ProcessPoolExecutor() as executor:
+        count = sum(1 for _ in parallel_primes_in_range(a, b, executor))
+    print(f'{count} primes in [{a}, {b}) in {perf_counter() - t0:.2f}s')
+
+if __name__ == '__main__':
+    main()
+
+# Планировщик: сначала самые долгие задания, дешевые - пакетами
+'''
+executor.map(check, numbers) возвращает результаты в порядке подачи, поэтому одно медленное простое число задерживает
+вывод всех, что идут за ним. Кроме того, порядок подачи определяет и время завершения всего пакета (makespan): если самое
+долгое задание попадет в пул последним, то остальные процессы будут простаивать, пока оно выполняется.
+schedule решает обе проблемы:
+> стоимость задания оценивается заранее; для проверки делением худший случай - isqrt(n) делений;
+> задания подаются в порядке убывания стоимости (эвристика LPT - Longest Processing Time first);
+> дешевые задания объединяются в пакеты с суммарной стоимостью не более target, чтобы не платить за пересылку
+  между процессами (сериализация, канал, десериализация) отдельно за каждое маленькое число;
+> результаты отдаются в порядке завершения с помощью futures.as_completed.
+'''
+
+CHUNKS_PER_WORKER = 4 # Чем больше, тем мельче пакеты и тем лучше балансировка в конце работы
+
+def estimate_cost(n: int) -> int:
+    return math.isqrt(n)
+
+def check_chunk(numbers: list[int], test: PrimeTest = is_prime_mr) -> list[PrimeResult]:
+    return [check(n, test) for n in numbers]
+
+def make_chunks(numbers: Iterable[int],
+                workers: int,
+                cost: Callable[[int], int] = estimate_cost) -> list[list[int]]:
+    '''Разбить числа на пакеты в порядке убывания стоимости'''
+    jobs = sorted(((cost(n), n) for n in numbers), reverse=True)
+    target = sum(c for c, _ in jobs) / (workers * CHUNKS_PER_WORKER) # Желаемая стоимость одного пакета
+    chunks: list[list[int]] = []
+    chunk: list[int] = []
+    chunk_cost = 0
+    for c, n in jobs:
+        if chunk and chunk_cost + c > target: # Дорогие задания (c >= target) всегда оказываются в пакете одни
+            chunks.append(chunk)
+            chunk, chunk_cost = [], 0
+        chunk.append(n)
+        chunk_cost += c
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def schedule(numbers: Iterable[int],
+             executor: futures.ProcessPoolExecutor,
+             test: PrimeTest = is_prime_mr,
+             cost: Callable[[int], int] = estimate_cost) -> Iterator[PrimeResult]:
+    chunks = make_chunks(numbers, executor._max_workers, cost)
+    to_do = [executor.submit(check_chunk, chunk, test) for chunk in chunks] # Пакеты уже упорядочены по убыванию стоимости
+    for future in futures.as_completed(to_do):
+        yield from future.result()
+
+def main() -> None:
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    with futures.ProcessPoolExecutor(workers) as executor:
+        print(f'Checking {len(NUMBERS)} numbers with {executor._max_workers} processes:')
+        t0 = perf_counter()
+        for n, prime, elapsed in schedule(NUMBERS, executor, test=is_prime): # Проверка делением: здесь стоимость заданий
+                                                                               # различается сильнее всего
+            label = 'P' if prime else ' '
+            print(f'{n:16} {label} {elapsed:9.6f}s')
+    print(f'Total time: {perf_counter() - t0:.2f}s')
+
+if __name__ == '__main__':
+    main()
+
+# Разделение одной большой проверки между процессами
+'''
+При проверке делением одно 16-значное простое число, например 9999999999999917, проверяется на одном ядре, а остальные
+в конце пакета простаивают. Но делители можно перебирать независимо: диапазон [3, isqrt(n)] делится на несколько
+участков (shards), и каждый участок проверяется в своем процессе. Если какой-то процесс нашел делитель, число составное,
+и остальные участки больше не нужны:
+> еще не начатые участки снимаются с помощью future.cancel();
+> уже выполняющиеся периодически (раз в SPLIT_BLOCK делителей) смотрят на флаг отмены в общем массиве cancelled
+  и прекращают работу.
+Массив cancelled (по байту на задание) создается функцией multiprocessing.RawArray и передается процессам пула через
+initializer при их запуске - передать его аргументом submit нельзя, разделяемые объекты не сериализуются.
+Делятся только дорогие задания (стоимостью выше SPLIT_THRESHOLD); дешевые проверяются целиком, как обычно.
+'''
+
+from multiprocessing import RawArray
+
+SPLIT_THRESHOLD = 10_000_000 # Задания с большим числом делителей делятся на участки
+SPLIT_BLOCK = 200_000 # Как часто участок проверяет флаг отмены; число четное, чтобы начало блока оставалось нечетным
+
+cancelled_jobs = None # В процессах пула сюда записывается массив флагов отмены
+
+def init_splitter(cancelled) -> None:
+    global cancelled_jobs
+    cancelled_jobs = cancelled
+
+def find_divisor(job: int, n: int, lo: int, hi: int) -> int | None:
+    '''Найти нечетный делитель n в [lo, hi); None, если его нет или задание отменено'''
+    for block in range(lo | 1, hi, SPLIT_BLOCK):
+        if cancelled_jobs[job]:
+            return None
+        for i in range(block, min(block + SPLIT_BLOCK, hi), 2):
+            if n % i == 0:
+                return i
+    return None
+
+def shard_bounds(n: int, shards: int) -> list[tuple[int, int]]:
+    root = math.isqrt(n)
+    bounds = [3 + (root - 2) * i // shards for i in range(shards + 1)]
+    return [(lo, hi) for lo, hi in zip(bounds, bounds[1:]) if lo < hi]
+
+def check_split(numbers: Iterable[int], workers: int | None = None) -> Iterator[PrimeResult]:
+    '''Проверка делением с разделением дорогих заданий; результаты отдаются в порядке готовности.
+    elapsed - время от постановки задания в очередь до получения ответа.'''
+    numbers = list(numbers)
+    cancelled = RawArray('b', len(numbers))
+    with futures.ProcessPoolExecutor(workers, initializer=init_splitter, initargs=(cancelled,)) as executor:
+        workers = executor._max_workers
+        shards_of: dict[int, list[futures.Future]] = {}
+        remaining: dict[int, int] = {} # Сколько участков задания еще не вернули ответ
+        job_of: dict[futures.Future, int] = {}
+        t0 = perf_counter()
+        for job, n in enumerate(numbers):
+            if n < 9 or n % 2 == 0: # Нечетных делителей от 3 до isqrt(n) нет - отвечаем сразу
+                yield PrimeResult(n, is_prime(n), 0.0)
+                continue
+            shards = max(1, min(workers, math.isqrt(n) // SPLIT_THRESHOLD))
+            shards_of[job] = [executor.submit(find_divisor, job, n, lo, hi) for lo, hi in shard_bounds(n, shards)]
+            remaining[job] = len(shards_of[job])
+            for future in shards_of[job]:
+                job_of[future] = job
+        for future in futures.as_completed(job_of):
+            job = job_of[future]
+            if job not in shards_of or future.cancelled(): # Ответ по этому заданию уже получен
+                continue
+            if future.result() is not None: # Делитель найден: отменить остальные участки
+                cancelled[job] = 1
+                for other in shards_of.pop(job):
+                    other.cancel()
+                yield PrimeResult(numbers[job], False, perf_counter() - t0)
+                continue
+            remaining[job] -= 1
+            if remaining[job] == 0: # Все участки пройдены без делителей
+                del shards_of[job]
+                yield PrimeResult(numbers[job], True, perf_counter() - t0)
+
+def main() -> None:
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    t0 = perf_counter()
+    for n, prime, elapsed in check_split(sorted(NUMBERS, reverse=True), workers):
+        label = 'P' if prime else ' '
+        print(f'{n:16} {label} {elapsed:9.6f}s')
+    print(f'Total time: {perf_counter() - t0:.2f}s')
+
+if __name__ == '__main__':
+    main()
+
+# Векторизованная проверка пакета чисел с NumPy
+'''
+check_many - пакетный аналог check (подробнее в главе 19): пробное деление всего массива uint64 на таблицу малых простых
+чисел и тест Миллера — Рабина для выживших чисел меньше 2 ** 32 выполняются векторными операциями NumPy, и лишь
+большие выжившие кандидаты проверяются скалярным тестом is_prime_mr.
+В пуле процессов удобно отдавать исполнителю не отдельные числа, а пакеты: executor.map(check_many, batches).
+'''
+
+import numpy as np
+
+SMALL_PRIME_LIMIT = 1000
+SMALL_PRIME_TABLE = np.array([p for p in range(SMALL_PRIME_LIMIT) if is_prime(p)], dtype=np.uint64)
+
+MR32_BASES = (2, 7, 61) # Для n < 4 759 123 141 (в том числе для всех n < 2 ** 32) тест с этими основаниями детерминирован
+
+def pow_mod_many(base: np.ndarray, exp: np.ndarray, mod: np.ndarray) -> np.ndarray:
+    '''Поэлементное base ** exp % mod; mod < 2 ** 32, чтобы произведения помещались в uint64'''
+    result = np.ones_like(mod)
+    base = base % mod
+    exp = exp.copy()
+    while exp.any():
+        result = np.where(exp & 1, result * base % mod, result)
+        base = base * base % mod
+        exp >>= 1
+    return result
+
+def miller_rabin_many(n: np.ndarray) -> np.ndarray:
+    '''Векторный тест Миллера — Рабина для нечетных 61 < n < 2 ** 32'''
+    if not n.size:
+        return np.zeros(0, dtype=bool)
+    d = n - 1
+    s = np.zeros_like(n)
+    while (even := (d & 1) == 0).any():
+        d[even] >>= 1
+        s[even] += 1
+    prime = np.ones(n.shape, dtype=bool)
+    for a in MR32_BASES:
+        x = pow_mod_many(np.full_like(n, a), d, n)
+        witness = (x != 1) & (x != n - 1) # Пока x не стал равен n - 1, основание a свидетельствует о составности
+        for r in range(1, int(s.max())):
+            active = witness & (r < s)
+            x = np.where(active, x * x % n, x)
+            witness &= ~(active & (x == n - 1))
+        prime &= ~witness
+    return prime
+
+def is_prime_many(candidates: np.ndarray, test: PrimeTest = is_prime_mr) -> np.ndarray:
+    '''Вернуть массив bool: True для простых элементов candidates'''
+    candidates = np.asarray(candidates, dtype=np.uint64)
+    result = np.zeros(candidates.shape, dtype=bool)
+    idx = np.flatnonzero(candidates >= 2) # Индексы чисел, простота которых еще не опровергнута
+    work = candidates[idx]
+    for p in SMALL_PRIME_TABLE:
+        divisible = work % p == 0
+        result[idx[divisible & (work == p)]] = True # Само p из таблицы - простое
+        keep = ~divisible
+        idx, work = idx[keep], work[keep] # Рабочий массив сжимается: после первых простых остается малая доля чисел
+    small = work < SMALL_PRIME_LIMIT ** 2 # Без делителей меньше SMALL_PRIME_LIMIT - значит, простые
+    result[idx[small]] = True
+    idx, work = idx[~small], work[~small]
+    mid = work < 2 ** 32
+    result[idx[mid]] = miller_rabin_many(work[mid])
+    for i in idx[~mid]: # Скалярная проверка только для выживших больших чисел
+        result[i] = test(int(candidates[i]))
+    return result
+
+def check_many(numbers: Iterable[int], test: PrimeTest = is_prime_mr) -> list[PrimeResult]:
+    numbers = list(numbers)
+    t0 = perf_counter()
+    flags = is_prime_many(np.array(numbers, dtype=np.uint64), test)
+    elapsed = (perf_counter() - t0) / max(len(numbers), 1)
+    return [PrimeResult(n, bool(flag), elapsed) for n, flag in zip(numbers, flags)]
+
+def main() -> None:
+    start, count, batch = 10**12, 10**6, 50_000
+    batches = [range(lo, min(lo + batch, start + count)) for lo in range(start, start + count, batch)]
+    t0 = perf_counter()
+    with futures.ProcessPoolExecutor() as executor:
+        primes = sum(prime for results in executor.map(check_many, batches) for _, prime, _ in results)
+    print(f'{primes} primes among {count} numbers in {perf_counter() - t0:.2f}s')
+
+if __name__ == '__main__':
+    main()
+
+# Сравнительный тест стратегий конкурентности: вычисления, ожидание и смешанная нагрузка
+'''
+В главах 19 и 20 одна и та же задача решается последовательно, потоками, процессами с очередями SimpleQueue, пулами
+исполнителей и сопрограммами, и каждый вариант сам печатает свое время. Чтобы выбрать стратегию по данным, а не на глаз,
+все варианты собраны в одном прогоне: каждая стратегия применяется к каждой нагрузке (Workload) при разном числе
+исполнителей, замер повторяется repeats раз, а в отчет попадают медиана, лучшее время, ускорение относительно
+последовательного варианта (speedup) и эффективность - ускорение, деленное на число исполнителей (efficiency).
+
+> cpu - проверка делением (is_prime) простых чисел около 10 ** 12: чистые вычисления, GIL не дает потокам ускорения.
+> io - сон, как в loiter, но без печати: потоки и сопрограммы ждут параллельно, процессы лишь добавляют накладные расходы.
+> mixed - вычисление и затем ожидание. Асинхронная версия вычисляет прямо в цикле событий и блокирует его на это время,
+  как is_prime в примере с индикатором из главы 19.
+> cpu-full - исходный набор NUMBERS; последовательная проверка занимает десятки секунд, поэтому по умолчанию не запускается.
+
+Если у нагрузки нет асинхронной версии (afunc), стратегия asyncio отдает функцию в asyncio.to_thread.
+Результаты каждого прогона сравниваются с результатами последовательного варианта, так что ошибка в стратегии не
+останется незамеченной за хорошими цифрами.
+'''
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import queue
+import statistics
+import threading
+from collections.abc import Awaitable, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+IO_DELAY = 0.05 # Секунд ожидания на единицу входного значения нагрузки io
+
+CPU_NUMBERS = tuple(itertools.islice(filter(is_prime_mr, itertools.count(10**12 + 1, 2)), 32))
+
+def nap(n: int) -> int:
+    time.sleep(n * IO_DELAY)
+    return n
+
+async def nap_async(n: int) -> int:
+    await asyncio.sleep(n * IO_DELAY)
+    return n
+
+def crunch_and_nap(n: int) -> bool:
+    prime = is_prime(n)
+    time.sleep(IO_DELAY)
+    return prime
+
+async def crunch_and_nap_async(n: int) -> bool:
+    prime = is_prime(n) # Блокирует цикл событий на время вычисления
+    await asyncio.sleep(IO_DELAY)
+    return prime
+
+@dataclass(frozen=True)
+class Workload:
+    func: Callable[[Any], Any] # Функция верхнего уровня модуля, чтобы ее можно было передать в другой процесс
+    inputs: tuple
+    afunc: Callable[[Any], Awaitable[Any]] | None = None
+
+WORKLOADS = {
+    'cpu': Workload(is_prime, CPU_NUMBERS),
+    'io': Workload(nap, (1,) * 40, nap_async),
+    'mixed': Workload(crunch_and_nap, CPU_NUMBERS, crunch_and_nap_async),
+    'cpu-full': Workload(is_prime, NUMBERS),
+}
+
+def queue_worker(func: Callable[[Any], Any], jobs, results) -> None:
+    '''Общий цикл для потоков и процессов: None в очереди jobs - сигнал завершиться'''
+    while (item := jobs.get()) is not None:
+        results.put(func(item))
+
+def run_sequential(workload: Workload, workers: int) -> list:
+    return [workload.func(x) for x in workload.inputs]
+
+def run_threading(workload: Workload, workers: int) -> list:
+    jobs: queue.SimpleQueue = queue.SimpleQueue()
+    results: queue.SimpleQueue = queue.SimpleQueue()
+    for x in workload.inputs:
+        jobs.put(x)
+    threads = [threading.Thread(target=queue_worker, args=(workload.func, jobs, results)) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+        jobs.put(None)
+    for thread in threads:
+        thread.join()
+    return [results.get() for _ in workload.inputs]
+
+def run_multiprocessing(workload: Workload, workers: int) -> list:
+    jobs = multiprocessing.SimpleQueue()
+    results = multiprocessing.SimpleQueue()
+    for x in workload.inputs:
+        jobs.put(x)
+    procs = [multiprocessing.Process(target=queue_worker, args=(workload.func, jobs, results)) for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+        jobs.put(None)
+    collected = [results.get() for _ in workload.inputs] # Забрать результаты до join: иначе процесс может навсегда
+                                                         # заблокироваться на записи в заполненный канал
+    for proc in procs:
+        proc.join()
+    return collected
+
+def run_thread_pool(workload: Workload, workers: int) -> list:
+    with futures.ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(workload.func, workload.inputs))
+
+def run_process_pool(workload: Workload, workers: int) -> list:
+    with futures.ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(workload.func, workload.inputs))
+
+async def gather_bounded(workload: Workload, workers: int) -> list:
+    semaphore = asyncio.Semaphore(workers) # Число одновременно выполняемых сопрограмм ограничено, как число потоков в пуле
+
+    async def run_one(x):
+        async with semaphore:
+            if workload.afunc is None:
+                return await asyncio.to_thread(workload.func, x)
+            return await workload.afunc(x)
+
+    return await asyncio.gather(*(run_one(x) for x in workload.inputs))
+
+def run_asyncio(workload: Workload, workers: int) -> list:
+    return asyncio.run(gather_bounded(workload, workers))
+
+EXECUTOR_STRATEGIES: dict[str, Callable[[Workload, int], list]] = {
+    'sequential': run_sequential,
+    'threading': run_threading,
+    'multiprocessing': run_multiprocessing,
+    'thread_pool': run_thread_pool,
+    'process_pool': run_process_pool,
+    'asyncio': run_asyncio,
+}
+
+def measure(strategy: str, workload: Workload, workers: int, repeats: int, expected: list) -> list[float]:
+    times = []
+    for _ in range(repeats):
+        t0 = perf_counter()
+        results = EXECUTOR_STRATEGIES[strategy](workload, workers)
+        times.append(perf_counter() - t0)
+        if sorted(results) != expected: # Потоки и процессы с очередями возвращают результаты в порядке готовности
+            raise RuntimeError(f'{strategy} returned wrong results with {workers} workers')
+    return times
+
+def run_suite(workloads: Sequence[str] = ('cpu', 'io', 'mixed'),
+              worker_counts: Sequence[int] = (1, 2, 4, 8),
+              repeats: int = 3,
+              strategies: Sequence[str] = tuple(EXECUTOR_STRATEGIES)) -> list[dict]:
+    rows = []
+    for workload_name in workloads:
+        workload = WORKLOADS[workload_name]
+        expected = sorted(run_sequential(workload, 1)) # Эталонные результаты; заодно прогрев перед замерами
+        sequential_times = measure('sequential', workload, 1, repeats, expected)
+        baseline = statistics.median(sequential_times)
+        for strategy in strategies:
+            counts = (1,) if strategy == 'sequential' else worker_counts # От числа исполнителей не зависит
+            for workers in counts:
+                if strategy == 'sequential':
+                    times = sequential_times
+                else:
+                    times = measure(strategy, workload, workers, repeats, expected)
+                median = statistics.median(times)
+                speedup = baseline / median
+                rows.append({'workload': workload_name,
+                             'strategy': strategy,
+                             'workers': workers,
+                             'times': times,
+                             'best': min(times),
+                             'median': median,
+                             'speedup': speedup,
+                             'efficiency': speedup / workers})
+    return rows
+
+def print_suite_report(rows: list[dict]) -> None:
+    print(f'{"workload":9} {"strategy":16} {"workers":>7} {"best,s":>7} {"median,s":>8} {"speedup":>7} {"effic.":>6}')
+    for row in rows:
+        print(f'{row["workload"]:9} {row["strategy"]:16} {row["workers"]:7} {row["best"]:7.3f} {row["median"]:8.3f} '
+              f'{row["speedup"]:7.2f} {row["efficiency"]:6.2f}')
+
+def suite_main() -> None:
+    parser = argparse.ArgumentParser(description='Compare concurrency strategies on CPU-bound, I/O-bound and mixed loads')
+    parser.add_argument('-l', '--workloads', nargs='+', choices=WORKLOADS, default=['cpu', 'io', 'mixed'])
+    parser.add_argument('-s', '--strategies', nargs='+', choices=EXECUTOR_STRATEGIES, default=list(EXECUTOR_STRATEGIES))
+    parser.add_argument('-w', '--workers', nargs='+', type=int, default=[1, 2, 4, 8])
+    parser.add_argument('-r', '--repeats', type=int, default=3)
+    parser.add_argument('-j', '--json', type=Path, help='file to save the results in JSON format')
+    # Другие примеры этого файла принимают число исполнителей единственным позиционным аргументом - принимаем его и здесь
+    parser.add_argument('workers_arg', nargs='?', type=int, metavar='workers',
+                        help='number of workers, same as in the other examples; overrides --workers')
+    args = parser.parse_args()
+    if args.workers_arg is not None:
+        args.workers = [args.workers_arg]
+    rows = run_suite(args.workloads, args.workers, args.repeats, args.strategies)
+    print_suite_report(rows)
+    if args.json:
+        args.json.write_text(json.dumps(rows, indent=2))
+
+if __name__ == '__main__':
+    suite_main()
+
+# Постоянный кеш результатов проверки на простоту
+'''
+Каждый запуск скриптов глав 19 и 20 заново проверяет одни и те же NUMBERS. Результаты проверки не меняются, поэтому их
+можно сохранить в базе SQLite: ключ - само число (INTEGER PRIMARY KEY, то есть rowid, поиск по B-дереву без отдельного
+индекса), значения - результат и время, затраченное на вычисление. Главный процесс одним запросом на пакет выясняет, какие
+числа уже проверены, и отдает пулу только промахи. Новые результаты записываются пакетами: executemany в одной транзакции
+на CACHE_BATCH результатов вместо транзакции на каждое число. Запись выполняет только главный процесс, так что
+процессы не соперничают за блокировку записи.
+В режиме WAL читатели не блокируют писателя и друг друга, поэтому кеш можно одновременно открыть только для чтения
+(readonly=True) из других процессов - например, из рабочих процессов пула или из параллельного запуска скрипта.
+Целые числа в SQLite знаковые 64-разрядные; числа больше SQLITE_MAX_INT проверяются, но не кешируются.
+Повторный запуск выводит сохраненные результаты, почти не тратя времени на вычисления.
+'''
+
+import sqlite3
+
+PRIME_CACHE_PATH = Path('primes.sqlite3')
+CACHE_BATCH = 256 # Результатов в одной транзакции записи
+LOOKUP_BATCH = 500 # Параметров в одном запросе SELECT ... IN (...); старые версии SQLite допускают не более 999
+SQLITE_MAX_INT = 2 ** 63 - 1
+
+class PrimeCache:
+
+    def __init__(self, path: Path = PRIME_CACHE_PATH, readonly: bool = False):
+        if readonly:
+            self.db = sqlite3.connect(f'{path.resolve().as_uri()}?mode=ro', uri=True)
+        else:
+            self.db = sqlite3.connect(path)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS primes '
+                            '(n INTEGER PRIMARY KEY, prime INTEGER NOT NULL, elapsed REAL NOT NULL)')
+
+    def __enter__(self) -> 'PrimeCache':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def lookup(self, numbers: Iterable[int]) -> dict[int, PrimeResult]:
+        '''Вернуть сохраненные результаты для тех чисел из numbers, которые уже есть в кеше'''
+        keys = [n for n in set(numbers) if n <= SQLITE_MAX_INT]
+        found = {}
+        for i in range(0, len(keys), LOOKUP_BATCH):
+            chunk = keys[i:i + LOOKUP_BATCH]
+            placeholders = ', '.join('?' * len(chunk))
+            for n, prime, elapsed in self.db.execute(f'SELECT n, prime, elapsed FROM primes WHERE n IN ({placeholders})',
+                                                     chunk):
+                found[n] = PrimeResult(n, bool(prime), elapsed)
+        return found
+
+    def store(self, results: Iterable[PrimeResult]) -> None:
+        with self.db: # Одна транзакция на весь пакет
+            self.db.executemany('INSERT OR REPLACE INTO primes (n, prime, elapsed) VALUES (?, ?, ?)',
+                                ((n, prime, elapsed) for n, prime, elapsed in results if n <= SQLITE_MAX_INT))
+
+    def close(self) -> None:
+        self.db.close()
+
+def check_cached(numbers: Iterable[int],
+                 cache: PrimeCache,
+                 executor: futures.Executor,
+                 batch_size: int = CACHE_BATCH) -> Iterator[PrimeResult]:
+    '''Выдать результаты для всех различных чисел из numbers: сначала найденные в кеше, затем вычисленные пулом'''
+    numbers = list(dict.fromkeys(numbers)) # Убрать повторы, сохранив порядок
+    known = cache.lookup(numbers)
+    yield from (known[n] for n in numbers if n in known)
+    misses = sorted((n for n in numbers if n not in known), reverse=True)
+    batch: list[PrimeResult] = []
+    try:
+        for result in executor.map(check, misses):
+            batch.append(result)
+            if len(batch) >= batch_size:
+                cache.store(batch)
+                batch.clear()
+            yield result
+    finally: # Даже если потребитель прекратил итерацию, уже вычисленные результаты не должны пропасть
+        cache.store(batch)
+
+def main() -> None:
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    t0 = perf_counter()
+    with PrimeCache() as cache, futures.ProcessPoolExecutor(workers) as executor:
+        for n, prime, elapsed in check_cached(NUMBERS, cache, executor):
+            label = 'P' if prime else ' '
+            print(f'{n:16} {label} {elapsed:9.6f}s') # elapsed - время исходного вычисления, даже если результат из кеша
+    print(f'Total time: {perf_counter() - t0:.2f}s')
+
+if __name__ == '__main__':
+    main()
+
 # Эксперименты с executor.map
 
 from time import sleep, strftime
@@ -287,4 +946,548 @@ if __name__ == '__main__':
 '''
 Очень полезно при работе с функцией futures.as_completed построить словарь, ставящий в соответствие каждому будущему объекту
 данные, которые можно будет использовать по завершении этого объекта.
-'''
\ No newline at end of file
+'''
+
+# Кеширование загрузок на диске и условные GET-запросы
+'''
+При каждом запуске download_many все флаги загружаются заново, даже если на сервере ничего не изменилось. Протокол HTTP
+позволяет этого избежать: сервер сопровождает ответ валидаторами - заголовками ETag и Last-Modified. Если при следующем
+запросе передать их обратно в заголовках If-None-Match и If-Modified-Since, то для неизменившегося ресурса сервер ответит
+кодом 304 (Not Modified) без тела, и содержимое можно взять из локального кеша.
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from functools import partial
+from http import HTTPStatus
+
+CACHE_DIR = Path('http_cache')
+
+class HTTPCache:
+    '''Кеш ответов на диске. Тела хранятся в файлах, названных по SHA-256 содержимого (одинаковые тела хранятся один раз),
+    а индекс url -> {digest, etag, last_modified} - в файле index.json'''
+
+    def __init__(self, cache_dir: Path = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.index_path = cache_dir / 'index.json'
+        cache_dir.mkdir(exist_ok=True)
+        try:
+            self.index: dict[str, dict] = json.loads(self.index_path.read_text())
+        except FileNotFoundError:
+            self.index = {}
+        self.lock = threading.Lock() # Защищает index: его обновляют и читают несколько потоков, а save обходит целиком
+
+    def validators(self, url: str) -> dict[str, str]:
+        '''Вернуть заголовки условного запроса для url; пустой словарь, если в кеше нет тела для этого url'''
+        with self.lock:
+            entry = self.index.get(url)
+        if entry is None or not (self.cache_dir / entry['digest']).exists(): # Без тела на диске ответ 304 бесполезен
+            return {}
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def body(self, url: str) -> bytes:
+        with self.lock:
+            digest = self.index[url]['digest']
+        return (self.cache_dir / digest).read_bytes()
+
+    def write_atomic(self, path: Path, data: bytes) -> None:
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp') # Уникальное имя: один и тот же файл могут
+                                                                           # записывать сразу несколько потоков или процессов
+        try:
+            with open(fd, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmp_name, path) # Переименование атомарно, поэтому никто не увидит недописанный файл
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+    def store(self, url: str, response: httpx.Response) -> bytes:
+        body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+        blob = self.cache_dir / digest
+        if not blob.exists():
+            self.write_atomic(blob, body)
+        with self.lock:
+            self.index[url] = {'digest': digest,
+                               'etag': response.headers.get('ETag'),
+                               'last_modified': response.headers.get('Last-Modified')}
+        return body
+
+    def save(self) -> None:
+        '''Записать индекс на диск; вызывается один раз по окончании пакета загрузок'''
+        with self.lock:
+            data = json.dumps(self.index).encode()
+        self.write_atomic(self.index_path, data)
+
+def cached_get(client: httpx.Client, cache: HTTPCache, url: str) -> bytes:
+    response = client.get(url, headers=cache.validators(url), timeout=6.1, follow_redirects=True)
+    if response.status_code == HTTPStatus.NOT_MODIFIED: # Ресурс не изменился: тело не передавалось, берем его с диска
+        try:
+            return cache.body(url)
+        except FileNotFoundError: # Файл удалили уже после проверки в validators - повторить запрос без условий
+            response = client.get(url, timeout=6.1, follow_redirects=True)
+    response.raise_for_status()
+    return cache.store(url, response)
+
+def get_flag(client: httpx.Client, cache: HTTPCache, cc: str) -> bytes:
+    url = f'{BASE_URL}/{cc}/{cc}.gif'.lower()
+    return cached_get(client, cache, url)
+
+def download_one(client: httpx.Client, cache: HTTPCache, cc: str) -> str:
+    image = get_flag(client, cache, cc)
+    save_flag(image, f'{cc}.gif')
+    print(cc, end=' ', flush=True)
+    return cc
+
+def download_many(cc_list: list[str]) -> int:
+    cache = HTTPCache()
+    with httpx.Client() as client: # Один клиент на все потоки: httpx.Client потокобезопасен и повторно использует соединения
+        with futures.ThreadPoolExecutor() as executor:
+            res = list(executor.map(partial(download_one, client, cache), sorted(cc_list)))
+    cache.save()
+    return len(res)
+
+def main(downloader: Callable[[list[str]], int]) -> None:
+    DEST_DIR.mkdir(exist_ok=True)
+    t0 = time.perf_counter()
+    count = downloader(POP20_CC)
+    elapsed = time.perf_counter() - t0
+    print(f'\n{count} downloads in {elapsed:.2f}s')
+
+if __name__ == '__main__':
+    main(download_many) # При повторном запуске сервер отвечает 304 на каждый запрос, и тела флагов по сети не передаются
+
+
+# Локальный сервер флагов и сравнительный тест загрузчиков
+'''
+Вместо клонирования репозитория книги и запуска python -m http.server можно поднять тестовый сервер прямо из скрипта.
+FlagServer ничего не читает с диска: флаги и metadata.json генерируются на лету, а задержка, доля ошибок 503, доля
+ответов 404 и пропускная способность соединения задаются в ServerConfig. Генератор случайных чисел инициализируется
+значением seed, так что последовательность отказов воспроизводима - это важно для сравнения стратегий и для CI.
+'''
+
+import asyncio
+import random
+import statistics
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections.abc import Iterable
+from itertools import product
+from string import ascii_uppercase
+from typing import TypeAlias
+
+ALL_CC = [''.join(pair) for pair in product(ascii_uppercase, repeat=2)] # Все 676 двухбуквенных кодов, от AA до ZZ
+
+@dataclass
+class ServerConfig:
+    latency: float = 0.1 # Задержка перед каждым ответом, в секундах
+    error_rate: float = 0.0 # Доля ответов 503 - Service Unavailable
+    not_found_rate: float = 0.0 # Доля ответов 404 - Not Found
+    bandwidth: int = 0 # Пропускная способность одного соединения в байтах в секунду; 0 - без ограничений
+    flag_size: int = 4096 # Размер генерируемого изображения флага в байтах
+    seed: int = 0
+
+class FlagHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Поддерживать постоянные соединения, как настоящий веб-сервер
+    disable_nagle_algorithm = True # Заголовки и тело уходят отдельными write; без TCP_NODELAY на постоянном соединении
+                                   # алгоритм Нейгла и отложенное подтверждение добавили бы к каждому ответу ~40 мс
+
+    def do_GET(self) -> None:
+        config = self.server.config
+        time.sleep(config.latency) # Обработчик работает в отдельном потоке ThreadingHTTPServer, так что sleep имитирует
+                                   # задержку сети, не мешая обслуживать другие запросы
+        roll = self.server.roll()
+        parts = self.path.strip('/').split('/') # Ожидается путь вида /flags/cn/cn.gif или /flags/cn/metadata.json
+        if len(parts) != 3 or parts[0] != 'flags' or roll < config.not_found_rate:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        if roll < config.not_found_rate + config.error_rate:
+            self.send_error(HTTPStatus.SERVICE_UNAVAILABLE)
+            return
+        _, cc, name = parts
+        if name == 'metadata.json':
+            body = json.dumps({'country': cc.upper()}).encode()
+            content_type = 'application/json'
+        elif name == f'{cc}.gif':
+            body = (b'GIF89a' + cc.encode() * config.flag_size)[:config.flag_size]
+            content_type = 'image/gif'
+        else:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.write_body(body, config.bandwidth)
+
+    def write_body(self, body: bytes, bandwidth: int) -> None:
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        chunk_size = max(1, bandwidth // 10) # Отправлять тело порциями по 1/10 секундного объема
+        for i in range(0, len(body), chunk_size):
+            chunk = body[i:i + chunk_size]
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) / bandwidth)
+
+    def log_message(self, format, *args) -> None:
+        pass # Не засорять вывод строкой журнала на каждый запрос
+
+class FlagServer(ThreadingHTTPServer):
+    '''Тестовый сервер флагов. Используется как контекстный менеджер: __enter__ запускает serve_forever в фоновом потоке,
+    __exit__ останавливает сервер. Порт 0 означает, что ОС выберет свободный порт.'''
+    daemon_threads = True
+
+    def __init__(self, config: ServerConfig, port: int = 0):
+        super().__init__(('127.0.0.1', port), FlagHandler)
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+
+    def roll(self) -> float:
+        with self.lock: # random.Random разделяется потоками-обработчиками
+            return self.random.random()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/flags'
+
+    def __enter__(self) -> 'FlagServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+        super().__exit__(*args)
+
+'''
+Сравнительный тест запускает на одном и том же наборе кодов стран четыре загрузчика, устроенных как download_many из этой
+и следующей главы: последовательный, ThreadPoolExecutor.map, executor.submit + futures.as_completed и asyncio с
+семафором. В отличие от первых примеров главы, адрес сервера они получают параметром base_url, а для каждой страны, как
+загрузчики главы 21, запрашивают и флаг, и metadata.json и сохраняют флаг в DEST_DIR под названием страны. Каждый
+загрузчик возвращает Counter исходов DownloadStatus.
+Задержку каждого HTTP-запроса измеряет TimingTransport: загрузчик передает его своему клиенту параметром transport - так же,
+как клиент из следующего раздела получает RateLimitedTransport. Время считается от отправки запроса до получения всего
+тела ответа.
+Параметры сервера, число кодов стран, стратегии, число исполнителей и повторов задаются в командной строке.
+'''
+
+import argparse
+from collections import Counter
+from enum import Enum
+
+DEFAULT_WORKERS = 20
+
+class DownloadStatus(Enum):
+    OK = 'ok'
+    NOT_FOUND = 'not found'
+    ERROR = 'error'
+
+Sample: TypeAlias = tuple[float, bool] # Задержка и успех одного HTTP-запроса
+
+class TimingTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    '''Транспорт и для httpx.Client, и для httpx.AsyncClient: передает запрос настоящему транспорту и записывает задержку'''
+
+    def __init__(self):
+        self.transport = httpx.HTTPTransport()
+        self.async_transport = httpx.AsyncHTTPTransport()
+        self.samples: list[Sample] = []
+        self.lock = threading.Lock() # Синхронным клиентом пользуются сразу несколько потоков
+
+    def record(self, t0: float, ok: bool) -> None:
+        with self.lock:
+            self.samples.append((perf_counter() - t0, ok))
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        t0 = perf_counter()
+        try:
+            response = self.transport.handle_request(request)
+            response.read() # Тело входит в задержку: иначе она не зависела бы от пропускной способности
+        except httpx.HTTPError:
+            self.record(t0, False)
+            raise
+        self.record(t0, response.is_success)
+        return response
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        t0 = perf_counter()
+        try:
+            response = await self.async_transport.handle_async_request(request)
+            await response.aread()
+        except httpx.HTTPError:
+            self.record(t0, False)
+            raise
+        self.record(t0, response.is_success)
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+    async def aclose(self) -> None:
+        await self.async_transport.aclose()
+
+def flag_filename(country: str) -> str:
+    return f'{country.replace(" ", "_")}.gif'
+
+def download_status(exc: httpx.HTTPError) -> DownloadStatus:
+    if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == HTTPStatus.NOT_FOUND:
+        return DownloadStatus.NOT_FOUND
+    return DownloadStatus.ERROR
+
+def fetch(client: httpx.Client, url: str) -> httpx.Response:
+    response = client.get(url.lower())
+    response.raise_for_status()
+    return response
+
+def download_country(client: httpx.Client, cc: str, base_url: str) -> DownloadStatus:
+    try:
+        image = fetch(client, f'{base_url}/{cc}/{cc}.gif').content
+        country = fetch(client, f'{base_url}/{cc}/metadata.json').json()['country']
+    except httpx.HTTPError as exc: # Ошибка одной страны не должна прерывать executor.map
+        return download_status(exc)
+    save_flag(image, flag_filename(country))
+    return DownloadStatus.OK
+
+def make_bench_client(transport: httpx.BaseTransport | None) -> httpx.Client:
+    return httpx.Client(transport=transport, timeout=6.1, follow_redirects=True)
+
+def download_many_sequential(cc_list: list[str],
+                             base_url: str = BASE_URL,
+                             concur_req: int = 1,
+                             transport: httpx.BaseTransport | None = None) -> Counter[DownloadStatus]:
+    with make_bench_client(transport) as client: # concur_req не используется: запросы выполняются по одному
+        return Counter(download_country(client, cc, base_url) for cc in sorted(cc_list))
+
+def download_many_threadpool(cc_list: list[str],
+                             base_url: str = BASE_URL,
+                             concur_req: int = DEFAULT_WORKERS,
+                             transport: httpx.BaseTransport | None = None) -> Counter[DownloadStatus]:
+    with make_bench_client(transport) as client, futures.ThreadPoolExecutor(concur_req) as executor:
+        return Counter(executor.map(partial(download_country, client, base_url=base_url), sorted(cc_list)))
+
+def download_many_as_completed(cc_list: list[str],
+                               base_url: str = BASE_URL,
+                               concur_req: int = DEFAULT_WORKERS,
+                               transport: httpx.BaseTransport | None = None) -> Counter[DownloadStatus]:
+    with make_bench_client(transport) as client, futures.ThreadPoolExecutor(concur_req) as executor:
+        to_do = [executor.submit(download_country, client, cc, base_url) for cc in sorted(cc_list)]
+        return Counter(future.result() for future in futures.as_completed(to_do))
+
+async def fetch_async(client: httpx.AsyncClient, url: str) -> httpx.Response:
+    response = await client.get(url.lower())
+    response.raise_for_status()
+    return response
+
+async def download_country_async(client: httpx.AsyncClient,
+                                 cc: str,
+                                 base_url: str,
+                                 semaphore: asyncio.Semaphore) -> DownloadStatus:
+    try:
+        async with semaphore:
+            image = (await fetch_async(client, f'{base_url}/{cc}/{cc}.gif')).content
+        async with semaphore:
+            country = (await fetch_async(client, f'{base_url}/{cc}/metadata.json')).json()['country']
+    except httpx.HTTPError as exc:
+        return download_status(exc)
+    await asyncio.to_thread(save_flag, image, flag_filename(country))
+    return DownloadStatus.OK
+
+async def download_supervisor(cc_list: list[str],
+                              base_url: str,
+                              concur_req: int,
+                              transport: httpx.AsyncBaseTransport | None) -> Counter[DownloadStatus]:
+    semaphore = asyncio.Semaphore(concur_req)
+    async with httpx.AsyncClient(transport=transport, timeout=6.1, follow_redirects=True) as client:
+        to_do = [download_country_async(client, cc, base_url, semaphore) for cc in sorted(cc_list)]
+        return Counter([await coro for coro in asyncio.as_completed(to_do)])
+
+def download_many_asyncio(cc_list: list[str],
+                          base_url: str = BASE_URL,
+                          concur_req: int = DEFAULT_WORKERS,
+                          transport: httpx.AsyncBaseTransport | None = None) -> Counter[DownloadStatus]:
+    return asyncio.run(download_supervisor(cc_list, base_url, concur_req, transport))
+
+Downloader: TypeAlias = Callable[[list[str], str, int, TimingTransport], Counter[DownloadStatus]]
+
+STRATEGIES: dict[str, Downloader] = {
+    'sequential': download_many_sequential,
+    'threadpool_map': download_many_threadpool,
+    'submit_as_completed': download_many_as_completed,
+    'asyncio_semaphore': download_many_asyncio,
+}
+
+def summarize(strategy: str, samples: list[Sample], counter: Counter[DownloadStatus], elapsed: float) -> dict:
+    '''Пропускная способность и процентили задержки для одного прогона стратегии'''
+    latencies = [latency for latency, _ in samples]
+    if len(latencies) < 2: # quantiles требует хотя бы двух значений
+        p50 = p95 = p99 = latencies[0] if latencies else 0.0
+    else:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive') # 99 точек деления: cuts[49] - медиана и т.д.
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    return {'strategy': strategy,
+            'requests': len(samples),
+            'errors': sum(not ok for _, ok in samples),
+            'downloads': counter[DownloadStatus.OK],
+            'elapsed': elapsed,
+            'throughput': len(samples) / elapsed if elapsed else 0.0,
+            'p50': p50,
+            'p95': p95,
+            'p99': p99}
+
+def run_benchmark(config: ServerConfig,
+                  cc_list: list[str],
+                  workers: int = DEFAULT_WORKERS,
+                  repeats: int = 3,
+                  strategies: Iterable[str] = tuple(STRATEGIES)) -> list[dict]:
+    DEST_DIR.mkdir(exist_ok=True)
+    rows = []
+    with FlagServer(config) as server:
+        for name in strategies:
+            for _ in range(repeats):
+                transport = TimingTransport() # Клиент закрывает свой транспорт, поэтому на каждый прогон - новый
+                t0 = perf_counter()
+                counter = STRATEGIES[name](cc_list, server.base_url, workers, transport)
+                rows.append(summarize(name, transport.samples, counter, perf_counter() - t0))
+    return rows
+
+def print_report(rows: list[dict]) -> None:
+    print(f'{"strategy":20} {"reqs":>5} {"errs":>5} {"flags":>5} {"time,s":>7} {"req/s":>8} '
+          f'{"p50,ms":>7} {"p95,ms":>7} {"p99,ms":>7}')
+    for row in rows:
+        print(f'{row["strategy"]:20} {row["requests"]:5} {row["errors"]:5} {row["downloads"]:5} {row["elapsed"]:7.2f} '
+              f'{row["throughput"]:8.1f} {row["p50"] * 1000:7.1f} {row["p95"] * 1000:7.1f} {row["p99"] * 1000:7.1f}')
+
+def bench_main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark flag download strategies against a local test server')
+    parser.add_argument('-n', '--count', type=int, default=200, help=f'number of country codes, up to {len(ALL_CC)}')
+    parser.add_argument('-s', '--strategies', nargs='+', choices=STRATEGIES, default=list(STRATEGIES))
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS, help='concurrent requests')
+    parser.add_argument('-r', '--repeats', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.05, help='server delay before each response, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.02, help='share of 503 responses')
+    parser.add_argument('--not-found-rate', type=float, default=0.02, help='share of 404 responses')
+    parser.add_argument('--bandwidth', type=int, default=256 * 1024, help='bytes per second per connection; 0 - unlimited')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-j', '--json', type=Path, help='file to save the results in JSON format')
+    # Другие примеры этого файла принимают число исполнителей единственным позиционным аргументом - принимаем его и здесь
+    parser.add_argument('workers_arg', nargs='?', type=int, metavar='workers',
+                        help='number of workers, same as in the other examples; overrides --workers')
+    args = parser.parse_args()
+    config = ServerConfig(latency=args.latency,
+                          error_rate=args.error_rate,
+                          not_found_rate=args.not_found_rate,
+                          bandwidth=args.bandwidth,
+                          seed=args.seed)
+    workers = args.workers if args.workers_arg is None else args.workers_arg
+    rows = run_benchmark(config, ALL_CC[:args.count], workers, args.repeats, args.strategies)
+    print_report(rows)
+    if args.json:
+        args.json.write_text(json.dumps(rows, indent=2))
+
+if __name__ == '__main__':
+    bench_main()
+
+
+# Ограничение темпа запросов и общий клиент с пулом соединений
+'''
+Загрузчики выше ограничивают только число одновременных запросов, но не число запросов в секунду, а многопоточный
+вариант к тому же вызывает httpx.get для каждого флага: функции верхнего уровня модуля httpx создают временный клиент
+на каждый вызов, поэтому TCP- и TLS-соединение устанавливается заново для каждого запроса.
+Решение состоит из двух частей:
+> make_client - фабрика общего клиента с ограничениями пула соединений (httpx.Limits) и постоянными соединениями;
+> TokenBucket - "ведро маркеров": маркеры пополняются с постоянной скоростью rate до емкости capacity, а каждый запрос
+забирает один маркер. Кратковременные всплески до capacity запросов проходят без задержки, а средний темп не превышает rate.
+Ведро защищено блокировкой threading.Lock, поэтому одним экземпляром могут пользоваться и потоки ThreadPoolExecutor
+(метод acquire), и сопрограммы asyncio (метод-сопрограмма acquire_async).
+'''
+
+RATE_LIMIT = 10.0 # Запросов в секунду - квота провайдера
+MAX_CONNECTIONS = 10
+MAX_KEEPALIVE = 10
+KEEPALIVE_EXPIRY = 30.0 # Сколько секунд простаивающее соединение остается в пуле
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        '''Забрать маркеры и вернуть время в секундах, через которое они станут доступны. Число маркеров может уйти
+        в минус: это "долг", который выплачивают следующие вызывающие, так что ожидающие обслуживаются по очереди.'''
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self, tokens: float = 1) -> None:
+        '''Для потоков: блокирует только вызывающий поток'''
+        if delay := self.reserve(tokens):
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: float = 1) -> None:
+        '''Для сопрограмм: уступает управление циклу событий на время ожидания'''
+        if delay := self.reserve(tokens):
+            await asyncio.sleep(delay)
+
+class RateLimitedTransport(httpx.HTTPTransport):
+    '''Транспорт, который перед каждым HTTP-запросом (включая перенаправления) забирает маркер из ведра'''
+
+    def __init__(self, bucket: TokenBucket, **kwargs):
+        super().__init__(**kwargs)
+        self.bucket = bucket
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.bucket.acquire()
+        return super().handle_request(request)
+
+def make_client(bucket: TokenBucket | None = None,
+                max_connections: int = MAX_CONNECTIONS,
+                max_keepalive: int = MAX_KEEPALIVE) -> httpx.Client:
+    '''Пул соединений httpx принадлежит клиенту; загрузчики обращаются к одному хосту, поэтому ограничения пула
+    фактически действуют на хост. Для нескольких хостов создайте по клиенту на каждый.'''
+    limits = httpx.Limits(max_connections=max_connections,
+                          max_keepalive_connections=max_keepalive,
+                          keepalive_expiry=KEEPALIVE_EXPIRY)
+    if bucket is None:
+        transport = httpx.HTTPTransport(limits=limits)
+    else:
+        transport = RateLimitedTransport(bucket, limits=limits)
+    return httpx.Client(transport=transport, timeout=6.1, follow_redirects=True)
+
+def get_flag(client: httpx.Client, cc: str) -> bytes:
+    url = f'{BASE_URL}/{cc}/{cc}.gif'.lower()
+    response = client.get(url)
+    response.raise_for_status()
+    return response.content
+
+def download_one(client: httpx.Client, cc: str) -> str:
+    image = get_flag(client, cc)
+    save_flag(image, f'{cc}.gif')
+    print(cc, end=' ', flush=True)
+    return cc
+
+def download_many(cc_list: list[str]) -> int:
+    bucket = TokenBucket(RATE_LIMIT)
+    with make_client(bucket) as client: # Один клиент и одно ведро на все потоки
+        with futures.ThreadPoolExecutor(MAX_CONNECTIONS) as executor: # Потоков не больше, чем соединений в пуле
+            res = list(executor.map(partial(download_one, client), sorted(cc_list)))
+    return len(res)
+
+if __name__ == '__main__':
+    main(download_many)
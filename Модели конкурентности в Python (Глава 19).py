@@ -299,6 +299,114 @@ async def is_prime_async(n: int) -> bool:
 с целью делегирования длительных вычислений другому процессу.
 '''
 
+# Автоматическая передача счетных функций в пул процессов
+'''
+Вместо того чтобы расставлять в счетном коде await asyncio.sleep(0), можно выполнить обычную функцию is_prime в другом
+процессе с помощью loop.run_in_executor и ждать результата, не блокируя цикл событий. run_in_process оборачивает функцию
+так, что ее вызов возвращает объект, допускающий ожидание, а работа выполняется в общем ProcessPoolExecutor.
+Отмена: если задача asyncio, ожидающая результата, отменена, то run_in_executor отменяет и будущий объект исполнителя.
+Задание, которое еще ждет в очереди, так и не будет запущено; уже выполняющееся задание прервать нельзя - процесс
+доработает его, а результат будет отброшен.
+Ограничение: функция должна сериализоваться модулем pickle по имени, поэтому run_in_process нельзя применять как
+декоратор с синтаксисом @ - под именем is_prime в модуле оказалась бы обертка, а не исходная функция. Обертку следует
+присваивать другому имени, как показано ниже.
+'''
+
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+process_pool: ProcessPoolExecutor | None = None
+
+def get_process_pool() -> ProcessPoolExecutor:
+    '''Пул создается при первом использовании и разделяется всеми обернутыми функциями'''
+    global process_pool
+    if process_pool is None:
+        process_pool = ProcessPoolExecutor()
+    return process_pool
+
+def shutdown_process_pool() -> None:
+    global process_pool
+    if process_pool is not None:
+        process_pool.shutdown(cancel_futures=True)
+        process_pool = None
+
+def run_in_process(func):
+    @functools.wraps(func)
+    async def offloaded(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_process_pool(), functools.partial(func, *args, **kwargs))
+    return offloaded
+
+is_prime_offloaded = run_in_process(is_prime) # Не @run_in_process: иначе pickle не найдет исходную is_prime
+
+async def slow_offloaded() -> bool:
+    return await is_prime_offloaded(5_000_111_000_222_021) # Индикатор крутится, хотя is_prime не содержит ни одного await
+
+async def supervisor_offloaded() -> bool:
+    spinner = asyncio.create_task(spin_asyncio('offloaded thinking'))
+    print(f'spinner object: {spinner}')
+    result = await slow_offloaded()
+    spinner.cancel()
+    return result
+
+def main_offloaded() -> None:
+    try:
+        result = asyncio.run(supervisor_offloaded())
+    finally:
+        shutdown_process_pool()
+    print(f'Answer: {result}')
+
+if __name__ == '__main__':
+    main_offloaded()
+
+# Детерминированный тест Миллера — Рабина
+'''
+Проверка делением (is_prime) перебирает нечетные делители до math.isqrt(n). Для 16-значных чисел из NUMBERS это около
+50 миллионов операций взятия остатка на каждое простое число - несколько секунд. Тест Миллера — Рабина выполняет
+всего несколько возведений в степень по модулю (встроенная функция pow с тремя аргументами):
+> записываем n - 1 = d * 2**s, где d нечетно;
+> для основания a вычисляем x = a**d mod n; если x равно 1 или n - 1, то a не свидетельствует о составности n;
+> иначе s - 1 раз возводим x в квадрат; если ни разу не получилось n - 1, то n точно составное.
+Для простого n ни одно основание не является свидетелем составности. Если взять в качестве оснований первые 13 простых
+чисел (от 2 до 41), то тест детерминирован (не ошибается) для всех n < 3.3 * 10**24 - в частности, для всех 64-разрядных чисел.
+Перед тестом число делится на простые числа меньше 100: это быстро отсеивает большинство составных чисел.
+Проверка делением остается эталонной реализацией, а выбрать реализацию можно аргументом test функции check.
+'''
+
+from collections.abc import Callable
+from typing import TypeAlias
+
+PrimeTest: TypeAlias = Callable[[int], bool]
+
+SIEVE_LIMIT = 100
+SIEVE_PRIMES = tuple(p for p in range(SIEVE_LIMIT) if is_prime(p)) # Простые числа меньше 100 для предварительного отсева
+MR_BASES = SIEVE_PRIMES[:13] # 2, 3, 5, ..., 41; с 12 основаниями (до 37) тест точен лишь для n < 3.18 * 10**23
+
+def is_prime_mr(n: int) -> bool:
+    '''Детерминированный тест Миллера — Рабина; для n >= 3.3 * 10**24 ошибка возможна, но маловероятна'''
+    if n < 2:
+        return False
+    for p in SIEVE_PRIMES:
+        if n % p == 0:
+            return n == p
+    if n < SIEVE_LIMIT ** 2: # Делителей меньше 100 нет, а составное число меньше 100**2 обязательно имело бы такой делитель
+        return True
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in MR_BASES:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else: # Цикл не прерван: a - свидетель составности n
+            return False
+    return True
+
 # Доморощенный пул процессов
 
 NUMBERS = (2,
@@ -338,9 +446,9 @@ class Result(NamedTuple):
     prime: bool
     elapsed: float
 
-def check(n: int) -> Result:
+def check(n: int, test: PrimeTest = is_prime_mr) -> Result:
     t0 = perf_counter()
-    prime = is_prime(n)
+    prime = test(n)
     return Result(prime, perf_counter() - t0)
 
 def main() -> None:
@@ -373,9 +481,9 @@ class PrimeResult(NamedTuple):
 JobQueue: TypeAlias = queues.SimpleQueue[int]
 ResultQueue: TypeAlias = queue.SimpleQueue[PrimeResult]
 
-def check(n: int) -> PrimeResult:
+def check(n: int, test: PrimeTest = is_prime_mr) -> PrimeResult:
     t0 = perf_counter()
-    res = is_prime(n)
+    res = test(n)
     return PrimeResult(n, res, perf_counter() - t0)
 
 def worker(jobs: JobQueue, results: ResultQueue) -> None:
@@ -429,3 +537,198 @@ def report(procs: int, results: ResultQueue) -> int:
 
 if __name__ == '__main__':
     main()
+
+# Передача результатов через разделяемую память
+'''
+В решении выше каждый PrimeResult сериализуется, проходит через канал SimpleQueue и десериализуется в главном процессе,
+а число 0 служит сигналом завершения. Когда заданий миллионы, а каждое проверяется за микросекунды (is_prime_mr), эти
+накладные расходы намного превышают сами вычисления.
+Вместо этого результаты можно записывать прямо в блок multiprocessing.shared_memory.SharedMemory, доступный всем
+процессам. Блок устроен как три параллельных массива, индексируемых номером задания:
+> numbers - проверяемые числа (беззнаковые 64-разрядные, формат 'Q');
+> elapsed - время проверки (формат 'd');
+> flags - признак простоты (формат 'B').
+memoryview.cast позволяет работать с участками блока как с типизированными массивами без копирования.
+Задания тоже не пересылаются: исполнители забирают очередной диапазон номеров, увеличивая общий счетчик
+multiprocessing.Value под его блокировкой, а в очередь done помещают только пары (start, stop) - одно сообщение на пакет
+из batch_size заданий. Сигнал завершения не нужен: главный процесс знает общее количество заданий.
+done - это multiprocessing.Queue, а не SimpleQueue: у ее метода get есть тайм-аут, поэтому, ожидая очередной пакет,
+главный процесс может периодически проверять, не завершился ли исполнитель аварийно. Иначе он ждал бы вечно пакета,
+который никто не пришлет. Если потребитель прекратит итерацию раньше времени, оставшиеся исполнители будут остановлены.
+'''
+
+from collections.abc import Iterable, Iterator
+from multiprocessing import shared_memory
+from multiprocessing.sharedctypes import Synchronized
+
+BATCH_SIZE = 10_000
+POLL_INTERVAL = 0.5 # Как часто (в секундах) проверять, живы ли исполнители, пока нет готовых пакетов
+BatchQueue: TypeAlias = 'queues.Queue[tuple[int, int]]' # В строке: в отличие от SimpleQueue, queues.Queue не
+                                                         # поддерживает индексирование во время выполнения
+
+def result_views(buf: memoryview, size: int) -> tuple[memoryview, memoryview, memoryview]:
+    '''Разметить блок разделяемой памяти: 8 * size байтов чисел, 8 * size байтов времени, size байтов признаков'''
+    numbers = buf[:8 * size].cast('Q')
+    elapsed = buf[8 * size:16 * size].cast('d')
+    flags = buf[16 * size:17 * size].cast('B')
+    return numbers, elapsed, flags
+
+def shm_worker(shm_name: str, size: int, batch_size: int, next_job: Synchronized, done: BatchQueue) -> None:
+    shm = shared_memory.SharedMemory(name=shm_name) # Подключиться к существующему блоку по имени
+    numbers, elapsed, flags = result_views(shm.buf, size)
+    try:
+        while True:
+            with next_job.get_lock(): # Атомарно забрать следующий диапазон номеров заданий
+                start = next_job.value
+                next_job.value = min(start + batch_size, size)
+            if start >= size:
+                break
+            stop = min(start + batch_size, size)
+            for i in range(start, stop):
+                _, flags[i], elapsed[i] = check(numbers[i]) # Запись прямо в разделяемую память
+            done.put((start, stop)) # Одно сообщение на пакет
+    finally:
+        numbers.release() # Представления нужно освободить до close, иначе возникнет BufferError
+        elapsed.release()
+        flags.release()
+        shm.close()
+
+def check_shared(numbers: Iterable[int], procs: int, batch_size: int = BATCH_SIZE) -> Iterator[PrimeResult]:
+    '''Проверить числа в procs процессах и отдавать результаты пакетами по мере их готовности'''
+    numbers = list(numbers)
+    size = len(numbers)
+    if not size: # Блок разделяемой памяти нулевого размера создать нельзя
+        return
+    shm = shared_memory.SharedMemory(create=True, size=17 * size)
+    shm_numbers, elapsed, flags = result_views(shm.buf, size)
+    workers: list[Process] = []
+    try:
+        for i, n in enumerate(numbers):
+            shm_numbers[i] = n
+        next_job = multiprocessing.Value('q', 0)
+        done: BatchQueue = multiprocessing.Queue()
+        workers.extend(Process(target=shm_worker, args=(shm.name, size, batch_size, next_job, done))
+                       for _ in range(procs))
+        for proc in workers:
+            proc.start()
+        checked = 0
+        while checked < size:
+            try:
+                start, stop = done.get(timeout=POLL_INTERVAL) # Исполнитель сообщил о готовности пакета - результаты
+                                                              # уже в разделяемой памяти
+            except queue.Empty:
+                if any(proc.exitcode for proc in workers) or not any(proc.is_alive() for proc in workers):
+                    raise RuntimeError(f'worker died, {size - checked} results lost') # Недостающие пакеты не придут
+                continue
+            for i in range(start, stop):
+                yield PrimeResult(numbers[i], bool(flags[i]), elapsed[i])
+            checked += stop - start
+    finally:
+        for proc in workers: # При нормальном завершении исполнители уже вышли; иначе их нужно остановить
+            if proc.pid is None: # Не был запущен
+                continue
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
+        shm_numbers.release()
+        elapsed.release()
+        flags.release()
+        shm.close()
+        shm.unlink() # Блок удаляет создавший его процесс, когда он больше никому не нужен
+
+def main() -> None:
+    procs = int(sys.argv[1]) if len(sys.argv) > 1 else cpu_count()
+    numbers = range(10**15, 10**15 + 10**6) # Миллион маленьких заданий
+    print(f'Checking {len(numbers)} numbers with {procs} processes:')
+    t0 = perf_counter()
+    primes = sum(prime for _, prime, _ in check_shared(numbers, procs))
+    print(f'{primes} primes in {perf_counter() - t0:.2f}s')
+
+if __name__ == '__main__':
+    main()
+
+# Векторизованная проверка пакета чисел с NumPy
+'''
+Для пакета чисел среднего размера вызов is_prime по одному числу в цикле Python медленный: основное время уходит на
+интерпретацию байт-кода, а не на арифметику. NumPy позволяет выполнить пробное деление сразу для всего массива:
+выражение candidates % p вычисляет остатки для всех чисел в одном цикле на C. Перебрав небольшую таблицу простых
+чисел (меньше SMALL_PRIME_LIMIT), мы отсеиваем большинство составных чисел. Числа меньше SMALL_PRIME_LIMIT ** 2, у которых
+не нашлось делителя, простые. Выжившие числа меньше 2 ** 32 проверяются векторным тестом Миллера — Рабина (для них
+произведения по модулю n помещаются в uint64), а большие - точным скалярным тестом, по умолчанию is_prime_mr.
+Массив имеет тип uint64, поэтому кандидаты должны быть меньше 2 ** 64.
+check_many - пакетный аналог check: возвращает список PrimeResult, в котором elapsed - среднее время на одно число.
+'''
+
+import numpy as np
+
+SMALL_PRIME_LIMIT = 1000
+SMALL_PRIME_TABLE = np.array([p for p in range(SMALL_PRIME_LIMIT) if is_prime(p)], dtype=np.uint64)
+
+MR32_BASES = (2, 7, 61) # Для n < 4 759 123 141 (в том числе для всех n < 2 ** 32) тест с этими основаниями детерминирован
+
+def pow_mod_many(base: np.ndarray, exp: np.ndarray, mod: np.ndarray) -> np.ndarray:
+    '''Поэлементное base ** exp % mod; mod < 2 ** 32, чтобы произведения помещались в uint64'''
+    result = np.ones_like(mod)
+    base = base % mod
+    exp = exp.copy()
+    while exp.any():
+        result = np.where(exp & 1, result * base % mod, result)
+        base = base * base % mod
+        exp >>= 1
+    return result
+
+def miller_rabin_many(n: np.ndarray) -> np.ndarray:
+    '''Векторный тест Миллера — Рабина для нечетных 61 < n < 2 ** 32'''
+    if not n.size:
+        return np.zeros(0, dtype=bool)
+    d = n - 1
+    s = np.zeros_like(n)
+    while (even := (d & 1) == 0).any():
+        d[even] >>= 1
+        s[even] += 1
+    prime = np.ones(n.shape, dtype=bool)
+    for a in MR32_BASES:
+        x = pow_mod_many(np.full_like(n, a), d, n)
+        witness = (x != 1) & (x != n - 1) # Пока x не стал равен n - 1, основание a свидетельствует о составности
+        for r in range(1, int(s.max())):
+            active = witness & (r < s)
+            x = np.where(active, x * x % n, x)
+            witness &= ~(active & (x == n - 1))
+        prime &= ~witness
+    return prime
+
+def is_prime_many(candidates: np.ndarray, test: PrimeTest = is_prime_mr) -> np.ndarray:
+    '''Вернуть массив bool: True для простых элементов candidates'''
+    candidates = np.asarray(candidates, dtype=np.uint64)
+    result = np.zeros(candidates.shape, dtype=bool)
+    idx = np.flatnonzero(candidates >= 2) # Индексы чисел, простота которых еще не опровергнута
+    work = candidates[idx]
+    for p in SMALL_PRIME_TABLE:
+        divisible = work % p == 0
+        result[idx[divisible & (work == p)]] = True # Само p из таблицы - простое
+        keep = ~divisible
+        idx, work = idx[keep], work[keep] # Рабочий массив сжимается: после первых простых остается малая доля чисел
+    small = work < SMALL_PRIME_LIMIT ** 2 # Без делителей меньше SMALL_PRIME_LIMIT - значит, простые
+    result[idx[small]] = True
+    idx, work = idx[~small], work[~small]
+    mid = work < 2 ** 32
+    result[idx[mid]] = miller_rabin_many(work[mid])
+    for i in idx[~mid]: # Скалярная проверка только для выживших больших чисел
+        result[i] = test(int(candidates[i]))
+    return result
+
+def check_many(numbers: Iterable[int], test: PrimeTest = is_prime_mr) -> list[PrimeResult]:
+    numbers = list(numbers)
+    t0 = perf_counter()
+    flags = is_prime_many(np.array(numbers, dtype=np.uint64), test)
+    elapsed = (perf_counter() - t0) / max(len(numbers), 1)
+    return [PrimeResult(n, bool(flag), elapsed) for n, flag in zip(numbers, flags)]
+
+def main() -> None:
+    numbers = range(10**12, 10**12 + 10**6)
+    t0 = perf_counter()
+    primes = sum(prime for _, prime, _ in check_many(numbers))
+    print(f'{primes} primes among {len(numbers)} numbers in {perf_counter() - t0:.2f}s')
+
+if __name__ == '__main__':
+    main()